@@ -1 +1,6 @@
-from .ui import ChatbotUI
\ No newline at end of file
+# ChatbotUI is imported lazily so headless entry points (cli.py) can use the app package without PyQt6
+def __getattr__(name):
+    if name == "ChatbotUI":
+        from .ui import ChatbotUI
+        return ChatbotUI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,164 @@
+import copy
+import threading
+from app.rate_limit import IMAGE_TOKEN_ESTIMATE
+
+try:
+    import tiktoken  # Optional: exact counts for OpenAI models, a close estimate for the others
+except ImportError:
+    tiktoken = None
+
+# Context window (input + output tokens) per model, matched by prefix, longest prefix first. Can be adjusted.
+MODEL_CONTEXT_LIMITS = [
+    ("gpt-4o-mini", 128000),
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-32k", 32768),
+    ("gpt-4", 8192),
+    ("gpt-3.5-turbo", 16385),
+    ("claude-", 200000),
+    ("gemini-1.5-pro", 2097152),
+    ("gemini-1.5-flash", 1048576),
+    ("gemini-1.0-pro-vision", 12288),
+    ("gemini-1.0-pro", 30720),
+    ("open-mistral-nemo", 128000),
+    ("mistral-large", 128000),
+    ("codestral", 32000),
+]
+DEFAULT_CONTEXT_LIMIT = 8192
+
+BUDGET_MARGIN = 0.05  # Share of the window left free for message framing and tokenizer differences between providers
+MESSAGE_OVERHEAD_TOKENS = 8  # Per history item or context file
+SAMPLE_CHARS = 100000  # Longer text is tokenized on a sample and extrapolated, so a huge file costs no more than this
+TRUNCATION_NOTE = "\n\n[... {tokens} tokens cut to fit the model's context window ...]"
+
+def context_limit(model):
+    for prefix, limit in MODEL_CONTEXT_LIMITS:
+        if model and model.startswith(prefix):
+            return limit
+    return DEFAULT_CONTEXT_LIMIT
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+def _encoding(model):
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base" if model and model.startswith("gpt-4o") else "cl100k_base")
+        return _encodings[model]
+
+def count_tokens(text, model=None):
+    if not text:
+        return 0
+    if tiktoken is None:
+        return len(text) // 4 + 1  # ~4 characters per token for English prose
+    encoding = _encoding(model)
+    if len(text) <= SAMPLE_CHARS:
+        return len(encoding.encode(text, disallowed_special=()))
+    sample = text[:SAMPLE_CHARS]
+    return int(len(encoding.encode(sample, disallowed_special=())) * len(text) / len(sample)) + 1
+
+def truncate_to_tokens(text, tokens, model=None):
+    # Keeps the start of text within roughly `tokens` tokens, noting how much was cut
+    total = count_tokens(text, model)
+    if total <= tokens:
+        return text
+    note_tokens = 20
+    keep_chars = int(len(text) * max(0, tokens - note_tokens) / total)
+    return text[:keep_chars] + TRUNCATION_NOTE.format(tokens=total - tokens)
+
+def _history_tokens(item, model):
+    item_type, item_content = item
+    if item_type == "image":
+        return IMAGE_TOKEN_ESTIMATE
+    return count_tokens(item_content, model) + MESSAGE_OVERHEAD_TOKENS
+
+def _text_tokens(entry, model):
+    # Context entries are shared by every request of a batch, so their counts are remembered on the entry
+    counts = entry.__dict__.setdefault("token_counts", {})
+    if model not in counts:
+        counts[model] = count_tokens(entry.text, model)
+    return counts[model]
+
+def _entry_tokens(entry, model):
+    return _text_tokens(entry, model) + len(entry.images) * IMAGE_TOKEN_ESTIMATE + MESSAGE_OVERHEAD_TOKENS
+
+class RequestPlan:
+    # The parts of one request after fitting them to the model's window. notes describes anything that was cut.
+    def __init__(self, limit, budget):
+        self.limit = limit
+        self.budget = budget
+        self.chat_history = []
+        self.context_entries = []
+        self.file_text = ""
+        self.file_images = []
+        self.tokens = 0
+        self.notes = []
+
+    @property
+    def trimmed(self):
+        return bool(self.notes)
+
+def plan_request(model, max_output_tokens, prompt, chat_history=None, context_files=None, file_text="", file_images=None, prompt_copies=1):
+    # Estimates every part of a request and, if it won't fit the window (less the reserved output), trims in order:
+    # oldest history first, then context files (largest lose the most), then the end of the file content and its images.
+    # The prompt itself is never cut. prompt_copies is how many times the request repeats the prompt.
+    limit = context_limit(model)
+    budget = int(limit * (1 - BUDGET_MARGIN)) - min(max_output_tokens or 0, limit // 4)
+    plan = RequestPlan(limit, budget)
+    chat_history = list(chat_history or [])
+    context_entries = list(context_files.entries) if context_files else []
+    file_images = list(file_images or [])
+    file_text = file_text or ""
+
+    fixed = count_tokens(prompt, model) * prompt_copies
+    history_tokens = [_history_tokens(item, model) for item in chat_history]
+    entry_tokens = [_entry_tokens(entry, model) for entry in context_entries]
+    file_tokens = count_tokens(file_text, model)
+    images_tokens = len(file_images) * IMAGE_TOKEN_ESTIMATE
+    total = fixed + sum(history_tokens) + sum(entry_tokens) + file_tokens + images_tokens
+
+    if total > budget and chat_history:
+        dropped = 0
+        while chat_history and total > budget:
+            chat_history.pop(0)
+            total -= history_tokens.pop(0)
+            dropped += 1
+        plan.notes.append(f"dropped the {dropped} oldest chat history items")
+
+    context_text = sum(_text_tokens(entry, model) for entry in context_entries)
+    if total > budget and context_text:
+        # Shrink each context file's text in proportion to its size; their images stay
+        room = max(0, context_text - (total - budget))
+        trimmed_entries = []
+        for entry in context_entries:
+            entry_text = _text_tokens(entry, model)
+            if entry_text:
+                entry = copy.copy(entry)  # Bundle entries are shared by the whole batch
+                entry.token_counts = {}
+                entry.text = truncate_to_tokens(entry.text, int(room * entry_text / context_text), model) if room else "[Left out to fit the model's context window]"
+            trimmed_entries.append(entry)
+        total -= context_text - room
+        context_entries = trimmed_entries
+        plan.notes.append(f"cut the context files to {room} of {context_text} tokens")
+
+    if total > budget and file_text:
+        room = max(0, file_tokens - (total - budget))
+        file_text = truncate_to_tokens(file_text, room, model)
+        total -= file_tokens - room
+        plan.notes.append(f"cut the file content to {room} of {file_tokens} tokens")
+
+    if total > budget and file_images:
+        keep = max(0, len(file_images) - -(-(total - budget) // IMAGE_TOKEN_ESTIMATE))
+        plan.notes.append(f"left out {len(file_images) - keep} of {len(file_images)} images")
+        total -= (len(file_images) - keep) * IMAGE_TOKEN_ESTIMATE
+        file_images = file_images[:keep]
+
+    plan.chat_history = chat_history
+    plan.context_entries = context_entries
+    plan.file_text = file_text
+    plan.file_images = file_images
+    plan.tokens = total
+    return plan
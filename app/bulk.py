@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app.usage import record_openai_usage, record_anthropic_usage
+from app.processor import (build_prompt, build_chatgpt_messages, build_claude_content,
+                           CHATGPT_MAX_TOKENS, CLAUDE_MAX_TOKENS)
+
+# Bulk mode: the same payloads process_chatgpt/process_claude build, submitted through the providers' batch
+# endpoints (results within 24h at reduced cost) instead of one request at a time. The endpoints are called
+# over plain REST so the base URLs can point at a local stand-in server for testing (benchmarks/bulk_standin.py).
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+ANTHROPIC_VERSION = "2023-06-01"
+
+BULK_DEVELOPERS = ("ChatGPT", "Claude")
+BULK_POLL_INTERVAL = 60  # Seconds between status checks
+# Requests per submitted batch, kept well under the provider limits (50,000 / 100,000 requests and 200-256 MB)
+BULK_MAX_REQUESTS = 10000
+BULK_MAX_BYTES = 150 * 1024 * 1024
+
+_session = requests.Session()
+
+def _openai_headers():
+    return {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"}
+
+def _anthropic_headers():
+    return {"x-api-key": os.getenv("ANTHROPIC_API_KEY"), "anthropic-version": ANTHROPIC_VERSION}
+
+def _check(response):
+    if response.status_code >= 400:
+        raise IOError(f"Batch endpoint returned {response.status_code}: {response.text[:500]}")
+    return response
+
+def build_bulk_request(developer, model, prompt, file_path, chat_history=None, context_files=None):
+    # One provider request body; prompt and context_files are expected to have been through build_prompt already
+    if developer == "ChatGPT":
+        messages = build_chatgpt_messages(model, prompt, file_path, chat_history, context_files)
+        return {"model": model, "messages": messages, "max_tokens": CHATGPT_MAX_TOKENS}
+    content = build_claude_content(model, prompt, file_path, chat_history, context_files)
+    return {"model": model, "max_tokens": CLAUDE_MAX_TOKENS, "messages": [{"role": "user", "content": content}]}
+
+def _request_line(developer, custom_id, body):
+    # The body as it appears in the provider's batch input, serialized once
+    if developer == "ChatGPT":
+        return json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+    return json.dumps({"custom_id": custom_id, "params": body})
+
+def _split(lines):
+    # Groups (custom_id, serialized request) into batches that respect BULK_MAX_REQUESTS and BULK_MAX_BYTES.
+    # Consumes lines lazily, so only the group being filled is held in memory.
+    group, group_bytes = [], 0
+    for custom_id, line in lines:
+        size = len(line)
+        if group and (len(group) >= BULK_MAX_REQUESTS or group_bytes + size > BULK_MAX_BYTES):
+            yield group
+            group, group_bytes = [], 0
+        group.append((custom_id, line))
+        group_bytes += size
+    if group:
+        yield group
+
+def _submit_openai(group):
+    lines = "\n".join(line for _, line in group)
+    upload = _check(_session.post(f"{OPENAI_BASE_URL}/files", headers=_openai_headers(),
+                                  files={"file": ("batch.jsonl", lines.encode("utf-8"))}, data={"purpose": "batch"})).json()
+    batch = _check(_session.post(f"{OPENAI_BASE_URL}/batches", headers=_openai_headers(), json={
+        "input_file_id": upload["id"],
+        "endpoint": "/v1/chat/completions",
+        "completion_window": "24h",
+    })).json()
+    return batch["id"]
+
+def _submit_anthropic(group):
+    data = ('{"requests": [' + ",".join(line for _, line in group) + "]}").encode("utf-8")
+    batch = _check(_session.post(f"{ANTHROPIC_BASE_URL}/v1/messages/batches", data=data,
+                                 headers={**_anthropic_headers(), "content-type": "application/json"})).json()
+    return batch["id"]
+
+def _ordered_map(function, items, max_workers):
+    # Like executor.map, but only a few results are built ahead of the consumer, so payloads (base64 images
+    # included) don't pile up in memory while a batch is being uploaded
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def submit_bulk(developer, model, prompt, file_paths, chat_history=None, context_files=None, max_workers=None):
+    # Builds the payloads (extraction runs in parallel) and submits them in as few batches as the limits allow,
+    # one batch at a time: each is uploaded as soon as it is full, so memory holds at most one batch of payloads.
+    # Returns (batches, errors): batches are JSON-friendly dicts {developer, batch_id, files: {custom_id: file_path}}
+    # that poll_bulk takes (and a job manifest can store); errors maps file paths that couldn't be built or
+    # submitted to a message.
+    if developer not in BULK_DEVELOPERS:
+        raise ValueError(f"Bulk mode supports {', '.join(BULK_DEVELOPERS)}, not {developer}")
+    prompt, context_files = build_prompt(prompt, context_files)
+
+    def build(file_path):
+        try:
+            return file_path, build_bulk_request(developer, model, prompt, file_path, chat_history, context_files), None
+        except Exception as e:
+            return file_path, None, f"Error processing file {file_path}: {str(e)}"
+
+    errors, files = {}, {}
+
+    def lines():
+        for i, (file_path, body, error) in enumerate(_ordered_map(build, file_paths, max_workers or os.cpu_count() or 1)):
+            if error:
+                errors[file_path] = error
+                continue
+            custom_id = f"file-{i:06d}"
+            files[custom_id] = file_path
+            yield custom_id, _request_line(developer, custom_id, body)
+
+    batches = []
+    submit = _submit_openai if developer == "ChatGPT" else _submit_anthropic
+    for group in _split(lines()):
+        group_files = {custom_id: files.pop(custom_id) for custom_id, _ in group}
+        try:
+            batch_id = submit(group)
+        except (IOError, requests.RequestException) as e:
+            # The batches already submitted are still returned, so they are polled rather than paid for twice
+            print(f"Failed to submit a {developer} batch of {len(group)} requests: {str(e)}", file=sys.stderr)
+            errors.update((file_path, f"Error processing request: {str(e)}") for file_path in group_files.values())
+            continue
+        batches.append({"developer": developer, "batch_id": batch_id, "files": group_files})
+        print(f"Submitted {developer} batch {batch_id} with {len(group)} requests", file=sys.stderr)
+    return batches, errors
+
+def _poll_openai(batch_id):
+    # Returns None while running, otherwise a list of (custom_id, result)
+    batch = _check(_session.get(f"{OPENAI_BASE_URL}/batches/{batch_id}", headers=_openai_headers())).json()
+    if batch["status"] in ("validating", "in_progress", "finalizing", "cancelling"):
+        return None
+    results = []
+    for key in ("output_file_id", "error_file_id"):
+        if not batch.get(key):
+            continue
+        content = _check(_session.get(f"{OPENAI_BASE_URL}/files/{batch[key]}/content", headers=_openai_headers())).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                record_openai_usage(response["body"].get("usage"))
+                results.append((item["custom_id"], response["body"]["choices"][0]["message"]["content"].strip()))
+            else:
+                error = item.get("error") or response.get("body", {}).get("error") or {}
+                results.append((item["custom_id"], f"Error processing request: {error.get('message', error)}"))
+    if batch["status"] != "completed":
+        results.append((None, f"Error processing request: batch {batch_id} ended as {batch['status']}"))
+    return results
+
+def _poll_anthropic(batch_id):
+    batch = _check(_session.get(f"{ANTHROPIC_BASE_URL}/v1/messages/batches/{batch_id}", headers=_anthropic_headers())).json()
+    if batch["processing_status"] != "ended":
+        return None
+    results = []
+    response = _check(_session.get(batch["results_url"], headers=_anthropic_headers(), stream=True))
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        item = json.loads(line)
+        result = item["result"]
+        if result["type"] == "succeeded":
+            record_anthropic_usage(result["message"].get("usage"))
+            results.append((item["custom_id"], result["message"]["content"][0]["text"]))
+        else:
+            error = result.get("error", {}).get("error", {}).get("message") or result["type"]
+            results.append((item["custom_id"], f"Error processing request: {error}"))
+    return results
+
+def poll_bulk(batches, poll_interval=BULK_POLL_INTERVAL):
+    # Generator yielding (file_path, result) for every file once its batch has ended.
+    # Files a provider never reported on come back as errors so they can be retried.
+    pending = list(batches)
+    while pending:
+        for batch in list(pending):
+            poll = _poll_openai if batch["developer"] == "ChatGPT" else _poll_anthropic
+            try:
+                results = poll(batch["batch_id"])
+            except (IOError, requests.RequestException) as e:
+                print(f"Failed to check batch {batch['batch_id']}, will retry: {str(e)}", file=sys.stderr)
+                continue
+            if results is None:
+                continue
+            pending.remove(batch)
+            reported = set()
+            batch_error = None
+            for custom_id, result in results:
+                if custom_id is None:
+                    batch_error = result
+                elif custom_id in batch["files"]:
+                    reported.add(custom_id)
+                    yield batch["files"][custom_id], result
+            for custom_id, file_path in batch["files"].items():
+                if custom_id not in reported:
+                    yield file_path, batch_error or "Error processing request: no result returned for this file"
+        if pending:
+            time.sleep(poll_interval)
+
+def run_bulk(developer, model, prompt, file_paths, chat_history=None, context_files=None, poll_interval=BULK_POLL_INTERVAL):
+    batches, errors = submit_bulk(developer, model, prompt, file_paths, chat_history, context_files)
+    for file_path, error in errors.items():
+        yield file_path, error
+    yield from poll_bulk(batches, poll_interval)
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+
+# Root for everything the app caches on disk, can be moved with BATCH_PROCESSOR_CACHE_DIR
+CACHE_DIR = os.getenv("BATCH_PROCESSOR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "batch-processor"))
+
+class DiskCache:
+    # Small JSON-on-disk key/value store with size-bounded LRU eviction.
+    # Entries live at <directory>/<key[:2]>/<key>.json; a hit refreshes the file's mtime, which is the LRU clock.
+    # Keys are expected to be hex digests. Safe to share between threads; writes are atomic renames so
+    # concurrent processes never see half-written entries.
+    def __init__(self, directory, max_bytes, ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # Seconds an entry stays valid after it was written, None for no expiry
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if self.ttl is not None and time.time() - entry["created"] > self.ttl:
+                self.delete(key)
+                return None
+            os.utime(path, None)
+            return entry["value"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Discarding unreadable cache entry {path}: {str(e)}", file=sys.stderr)
+            self.delete(key)
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "value": value}, f)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Failed to write cache entry {path}: {str(e)}", file=sys.stderr)
+            return
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += size - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total_bytes = 0
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # Removed by another thread or process
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, _, size in self._entries())
+
+    def _evict(self):
+        # Least recently used first, down to 90% of the limit so we don't evict on every write
+        target = self.max_bytes * 0.9
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
@@ -0,0 +1,113 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from app.processor import (process_request, is_error_result,
+                           CHATGPT_MAX_TOKENS, CLAUDE_MAX_TOKENS, GEMINI_MAX_TOKENS, MISTRAL_MAX_TOKENS)
+from app.budget import context_limit, count_tokens, BUDGET_MARGIN
+from app.utils import read_file
+from app.context import IMAGE_EXTENSIONS, prepare_context
+
+# Map-reduce mode for documents larger than the model's window: the text is split into overlapping chunks,
+# the prompt is run on every chunk concurrently (map) and the partial answers are combined by one more request (reduce).
+MAP_CHUNK_TOKENS = 12000  # Upper bound on chunk size, can be adjusted; smaller if the model's window is smaller
+MAP_CHUNK_OVERLAP = 300  # Tokens repeated between neighbouring chunks so nothing is lost at a boundary
+MAP_CONCURRENCY = 4  # Chunk requests in flight per file (the developer's concurrency limit still applies)
+MAX_REDUCE_ROUNDS = 3  # Rounds of combining groups of partial answers before the last request takes what fits
+
+MAP_PROMPT = ("{prompt}\n\n"
+              "The file is too long to send at once, so you are given one part of it. Answer for this part only; "
+              "your answers for all parts will be combined afterwards.")
+REDUCE_PROMPT = ("{prompt}\n\n"
+                 "The file was too long to send at once, so the request was answered for each part separately. "
+                 "The file content below is those partial answers, in order. Combine them into one answer for the whole file.")
+
+MAX_OUTPUT_TOKENS = {
+    "ChatGPT": CHATGPT_MAX_TOKENS,
+    "Claude": CLAUDE_MAX_TOKENS,
+    "Gemini": GEMINI_MAX_TOKENS,
+    "Mistral": MISTRAL_MAX_TOKENS,
+}
+
+def split_text(text, chunk_tokens, overlap_tokens=MAP_CHUNK_OVERLAP, model=None):
+    # Overlapping chunks of about chunk_tokens tokens, broken at a paragraph, line or sentence end where possible
+    total = count_tokens(text, model)
+    if total <= chunk_tokens:
+        return [text]
+    chars_per_token = len(text) / total
+    size = max(1, int(chunk_tokens * chars_per_token))
+    overlap = min(int(overlap_tokens * chars_per_token), size // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            for separator in ("\n\n", "\n", ". "):
+                cut = text.rfind(separator, start + size * 4 // 5, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def chunk_budget(developer, model, prompt, chat_history=None, context_files=None):
+    # Tokens left for a chunk once the prompt, history, context and the reserved answer are accounted for
+    limit = context_limit(model)
+    budget = int(limit * (1 - BUDGET_MARGIN)) - min(MAX_OUTPUT_TOKENS.get(developer, 0), limit // 4)
+    budget -= 2 * count_tokens(MAP_PROMPT.format(prompt=prompt), model)
+    budget -= sum(count_tokens(item_content, model) for item_type, item_content in chat_history or [] if item_type == "text")
+    if context_files:
+        budget -= sum(count_tokens(entry.text, model) for entry in context_files.entries)
+    return max(1000, min(MAP_CHUNK_TOKENS, budget))
+
+def process_map_reduce(developer, model, prompt, file_path, chat_history=None, context_files=None, on_token=None, slot=None):
+    # Like process_request, but a document that doesn't fit in one request is answered chunk by chunk.
+    # slot (e.g. the developer's semaphore) is held around each individual request, never around the whole file,
+    # so a long document can't tie up the concurrency limit its own chunks are waiting for.
+    def request(request_prompt, text=None, callback=None):
+        if slot is None:
+            return process_request(developer, model, request_prompt, file_path, chat_history, context_files, callback, text)
+        with slot:
+            return process_request(developer, model, request_prompt, file_path, chat_history, context_files, callback, text)
+
+    if not file_path or file_path.lower().endswith(IMAGE_EXTENSIONS) or model in ["dall-e-3", "dall-e-2", "whisper-1"]:
+        return request(prompt, callback=on_token)
+
+    try:
+        text, _ = read_file(file_path, include_images=False)
+    except Exception as e:
+        return f"Error processing file {file_path}: {str(e)}"
+    context_files = prepare_context(context_files)
+    chunk_tokens = chunk_budget(developer, model, prompt, chat_history, context_files)
+    chunks = split_text(text, chunk_tokens, model=model)
+    if len(chunks) == 1:
+        return request(prompt, callback=on_token)  # Fits, images and all
+
+    name = os.path.basename(file_path)
+    print(f"{name} is too long for one {model} request, processing it in {len(chunks)} parts", file=sys.stderr)
+    map_prompt = MAP_PROMPT.format(prompt=prompt)  # Identical for every part, so the shared prefix stays cacheable
+    with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY, thread_name_prefix="map") as executor:
+        partials = list(executor.map(
+            lambda numbered: request(map_prompt, f"[Part {numbered[0]} of {len(chunks)}]\n\n{numbered[1]}"),
+            enumerate(chunks, start=1)))
+
+    for i, partial in enumerate(partials, start=1):
+        if is_error_result(partial) or not isinstance(partial, str):
+            return f"Error processing file {file_path}: part {i} of {len(chunks)} failed: {partial}"
+
+    # Partial answers that together are still too long are combined in groups first
+    reduce_prompt = REDUCE_PROMPT.format(prompt=prompt)
+    for _ in range(MAX_REDUCE_ROUNDS):
+        combined = "\n\n".join(f"[Answer for part {i}]\n{partial}" for i, partial in enumerate(partials, start=1))
+        groups = split_text(combined, chunk_tokens, overlap_tokens=0, model=model)
+        if len(groups) == 1:
+            break
+        with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY, thread_name_prefix="reduce") as executor:
+            partials = list(executor.map(lambda group: request(reduce_prompt, group), groups))
+        for partial in partials:
+            if is_error_result(partial) or not isinstance(partial, str):
+                return f"Error processing file {file_path}: combining the parts failed: {partial}"
+    combined = "\n\n".join(f"[Answer for part {i}]\n{partial}" for i, partial in enumerate(partials, start=1))
+    return request(reduce_prompt, combined, on_token)
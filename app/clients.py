@@ -0,0 +1,64 @@
+import os
+import threading
+import httpx
+from openai import OpenAI
+import google.generativeai as genai
+from anthropic import Anthropic
+from mistralai.client import MistralClient
+from app.rate_limit import observe_response
+
+# Keep-alive connections per provider. The batch scheduler raises this to its concurrency so every
+# in-flight request has a pooled connection instead of opening a new one.
+POOL_SIZE = 8
+REQUEST_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def set_pool_size(size):
+    # Pools only grow; clients built with a smaller pool are dropped and rebuilt on next use
+    global POOL_SIZE
+    with _clients_lock:
+        if size > POOL_SIZE:
+            POOL_SIZE = size
+            _clients.clear()
+
+def _http_client(developer):
+    # Every response's rate-limit headers are fed to the rate limiter for that developer
+    limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+    hooks = {"response": [lambda response: observe_response(developer, response)]}
+    return httpx.Client(limits=limits, timeout=REQUEST_TIMEOUT, event_hooks=hooks)
+
+def _get_client(key, factory):
+    # Clients are created once per provider and API key, then shared by every thread
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+        return client
+
+# The SDKs' own retries are turned off, app.rate_limit handles retries and backoff for every provider
+def get_openai_client():
+    api_key = os.getenv("OPENAI_API_KEY")
+    return _get_client(("ChatGPT", api_key), lambda: OpenAI(api_key=api_key, http_client=_http_client("ChatGPT"), max_retries=0))
+
+def get_anthropic_client():
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    return _get_client(("Claude", api_key), lambda: Anthropic(api_key=api_key, http_client=_http_client("Claude"), max_retries=0))
+
+def get_mistral_client():
+    # MistralClient manages its own pooled httpx client, reusing the instance keeps its connections alive
+    api_key = os.getenv("MISTRAL_API_KEY")
+    return _get_client(("Mistral", api_key), lambda: MistralClient(api_key=api_key, max_retries=0))
+
+def get_gemini_model(model_name):
+    # genai.configure is global, so it only runs when the key changes; the gRPC channel behind it is shared
+    api_key = os.getenv("GOOGLE_API_KEY")
+
+    def configure():
+        genai.configure(api_key=api_key)
+        return api_key
+
+    _get_client(("Gemini", api_key), configure)
+    return _get_client(("Gemini", api_key, model_name), lambda: genai.GenerativeModel(model_name=model_name))
@@ -0,0 +1,110 @@
+import os
+import hashlib
+import threading
+from app.utils import read_file, file_digest
+from app.read_files import process_image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+class ContextEntry:
+    # One extracted context file. kind is "image", "document" or "error"; images holds base64 JPEG strings.
+    def __init__(self, path, kind, text="", images=None, error=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.kind = kind
+        self.text = text
+        self.images = images or []
+        self.error = error
+
+class ContextBundle:
+    # The context directory extracted once and shared (read-only) by every request of a batch.
+    # Each file is remembered by mtime/size/hash so the bundle can tell when it needs to be rebuilt.
+    def __init__(self, file_paths):
+        self.file_paths = list(file_paths)
+        self.entries = []
+        self._signatures = {}
+        self._summary = None
+        for file_path in self.file_paths:
+            self._signatures[file_path] = self._signature(file_path)
+            self.entries.append(self._extract(file_path))
+
+    def _signature(self, file_path):
+        try:
+            stat = os.stat(file_path)
+            return stat.st_mtime_ns, stat.st_size, file_digest(file_path)
+        except OSError:
+            return None
+
+    def _extract(self, file_path):
+        try:
+            if file_path.lower().endswith(IMAGE_EXTENSIONS):
+                with open(file_path, "rb") as image_file:
+                    image_bytes = image_file.read()
+                img_str = process_image(image_bytes)
+                return ContextEntry(file_path, "image", images=[img_str] if img_str else [])
+            text, images = read_file(file_path)
+            return ContextEntry(file_path, "document", text=text, images=images)
+        except Exception as e:
+            return ContextEntry(file_path, "error", error=str(e))
+
+    def is_stale(self):
+        # Cheap stat check first; a file is only re-hashed when its mtime or size moved
+        for file_path, signature in self._signatures.items():
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                return True
+            if signature is None:
+                return True
+            mtime_ns, size, digest = signature
+            if (stat.st_mtime_ns, stat.st_size) == (mtime_ns, size):
+                continue
+            if stat.st_size != size or file_digest(file_path) != digest:
+                return True
+            # Touched but unchanged, remember the new mtime so it isn't hashed again
+            self._signatures[file_path] = (stat.st_mtime_ns, size, digest)
+        return False
+
+    def digest(self):
+        # Hash of the file names and contents, in order (e.g. for the response cache key)
+        sha = hashlib.sha256()
+        for file_path in self.file_paths:
+            signature = self._signatures.get(file_path)
+            sha.update(f"{os.path.basename(file_path)}:{signature[2] if signature else None}\n".encode())
+        return sha.hexdigest()
+
+    def summary_text(self):
+        # Plain-text rendering of the whole bundle (what read_context_files returns)
+        if self._summary is None:
+            context_content = []
+            for entry in self.entries:
+                if entry.kind == "image":
+                    if entry.images:
+                        context_content.append(f"Image file: {entry.name}\nBase64: {entry.images[0][:20]}...")
+                    else:
+                        context_content.append(f"Failed to process image file: {entry.name}")
+                elif entry.kind == "document":
+                    context_content.append(f"Content of {entry.name}:\n{entry.text}\n")
+                else:
+                    context_content.append(f"Error reading {entry.name}: {entry.error}\n")
+            self._summary = "\n".join(context_content)
+        return self._summary
+
+_bundles = {}
+_bundles_lock = threading.Lock()
+
+def get_context_bundle(file_paths):
+    # Returns the cached bundle for these files, rebuilding it only if one of them changed on disk
+    key = tuple(file_paths)
+    with _bundles_lock:
+        bundle = _bundles.get(key)
+        if bundle is None or bundle.is_stale():
+            bundle = ContextBundle(key)
+            _bundles[key] = bundle
+        return bundle
+
+def prepare_context(context_files):
+    # Accepts a list of paths or an existing bundle, so callers can pass either
+    if not context_files or isinstance(context_files, ContextBundle):
+        return context_files
+    return get_context_bundle(context_files)
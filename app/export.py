@@ -0,0 +1,174 @@
+import os
+import base64
+import hashlib
+from html import escape
+
+# Save Output writes the HTML report item by item instead of building it in memory first.
+# Defaults, can be adjusted here or with BATCH_PROCESSOR_EXPORT_*:
+EXPORT_SIDECAR_IMAGES = os.getenv("BATCH_PROCESSOR_EXPORT_SIDECAR_IMAGES", "0") == "1"  # .jpg files next to the report instead of inline base64
+EXPORT_PAGE_SIZE = int(os.getenv("BATCH_PROCESSOR_EXPORT_PAGE_SIZE", "0"))  # Items per HTML page, with an index page; 0 for a single file
+
+CSS = """
+<style>
+    body {
+        font-family: 'Segoe UI', Arial, sans-serif;
+        line-height: 1.6;
+        color: #333;
+        max-width: 800px;
+        margin: 0 auto;
+        padding: 20px;
+        background-color: #f0f0f0;
+    }
+    .chat-item {
+        margin-bottom: 20px;
+        padding: 10px;
+        border-radius: 5px;
+        background-color: #fff;
+        box-shadow: 0 1px 3px rgba(0,0,0,0.12), 0 1px 2px rgba(0,0,0,0.24);
+    }
+    .chat-item img {
+        max-width: 100%;
+        height: auto;
+        margin-top: 10px;
+    }
+    .separator {
+        border: none;
+        border-top: 1px solid #ddd;
+        margin: 20px 0;
+    }
+    .pages a {
+        margin-right: 10px;
+    }
+</style>
+"""
+
+def html_header(title):
+    return '\n'.join([
+        '<!DOCTYPE html>',
+        '<html lang="en">',
+        '<head>',
+        '<meta charset="UTF-8">',
+        '<meta name="viewport" content="width=device-width, initial-scale=1.0">',
+        f'<title>{escape(title)}</title>',
+        CSS,
+        '</head>',
+        '<body>',
+        f'<h1>{escape(title)}</h1>',
+        '',
+    ])
+
+class HtmlExporter:
+    # Use as a context manager; add_text/add_image write each item straight to disk.
+    # With page_size, report.html becomes an index of report-0001.html, report-0002.html, ...
+    # (a run that fits on one page is still a single report.html).
+    def __init__(self, path, sidecar_images=EXPORT_SIDECAR_IMAGES, page_size=EXPORT_PAGE_SIZE, title="Conversation History"):
+        self.path = path
+        self.sidecar_images = sidecar_images
+        self.page_size = page_size
+        self.title = title
+        self.stem, _ = os.path.splitext(path)
+        self.images_dir = f"{self.stem}_files"
+        self.pages = []  # (file path, first item, last item)
+        self._file = None
+        self._items = 0
+        self._page_items = 0
+        self._written_images = set()
+        self.files = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _page_path(self, number):
+        return f"{self.stem}-{number:04d}.html" if self.page_size else self.path
+
+    def _start_item(self):
+        if self._file is None or (self.page_size and self._page_items >= self.page_size):
+            self._end_page(has_next=self._file is not None)
+            path = self._page_path(len(self.pages) + 1)
+            self._file = open(path, 'w', encoding='utf-8')
+            title = f"{self.title} (page {len(self.pages) + 1})" if self.page_size else self.title
+            self._file.write(html_header(title))
+            self.pages.append([path, self._items + 1, self._items + 1])
+            self._page_items = 0
+        self._items += 1
+        self._page_items += 1
+        self.pages[-1][2] = self._items
+
+    def _end_page(self, has_next=False, has_index=True):
+        if self._file is None:
+            return
+        if self.page_size:
+            number = len(self.pages)
+            links = []
+            if number > 1:
+                links.append(f'<a href="{escape(os.path.basename(self._page_path(number - 1)))}">Previous</a>')
+            if has_index:
+                links.append(f'<a href="{escape(os.path.basename(self.path))}">Index</a>')
+            if has_next:
+                links.append(f'<a href="{escape(os.path.basename(self._page_path(number + 1)))}">Next</a>')
+            if links:
+                self._file.write(f'<p class="pages">{" ".join(links)}</p>\n')
+        self._file.write('</body></html>')
+        self._file.close()
+        self._file = None
+
+    def add_text(self, text):
+        self._start_item()
+        formatted_text = escape(text).replace('\n', '<br>')  # Preserve line breaks
+        self._file.write(f'<div class="chat-item">\n<p>{formatted_text}</p>\n</div>\n')
+
+    def add_image(self, data, digest=None):
+        # data: JPEG, or PNG for generated images
+        self._start_item()
+        ext, mime_type = ("png", "image/png") if data.startswith(b"\x89PNG") else ("jpg", "image/jpeg")
+        if self.sidecar_images:
+            digest = digest or hashlib.sha256(data).hexdigest()
+            name = f"{digest[:16]}.{ext}"
+            if name not in self._written_images:
+                os.makedirs(self.images_dir, exist_ok=True)
+                with open(os.path.join(self.images_dir, name), 'wb') as f:
+                    f.write(data)
+                self._written_images.add(name)
+            src = f"{os.path.basename(self.images_dir)}/{name}"
+        else:
+            src = f"data:{mime_type};base64,{base64.b64encode(data).decode()}"
+        self._file.write(f'<div class="chat-item">\n<img src="{escape(src)}" alt="Conversation Image">\n</div>\n')
+
+    def close(self):
+        # Returns the files written, index first
+        if self.files is not None:
+            return self.files
+        if not self.pages:
+            # Nothing was added, still leave an (empty) report
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(html_header(self.title))
+            self.pages.append([self.path, 0, 0])
+        single_page = len(self.pages) == 1
+        self._end_page(has_index=not single_page)
+        if single_page:
+            if self.pages[0][0] != self.path:
+                os.replace(self.pages[0][0], self.path)
+                self.pages[0][0] = self.path
+            self.files = [self.path]
+            return self.files
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(html_header(self.title))
+            f.write(f'<p>{self._items} items on {len(self.pages)} pages</p>\n<ul>\n')
+            for number, (path, first, last) in enumerate(self.pages, start=1):
+                f.write(f'<li><a href="{escape(os.path.basename(path))}">Page {number}</a>: items {first} to {last}</li>\n')
+            f.write('</ul>\n</body></html>')
+        self.files = [self.path] + [path for path, _, _ in self.pages]
+        return self.files
+
+def export_items(path, items, sidecar_images=EXPORT_SIDECAR_IMAGES, page_size=EXPORT_PAGE_SIZE):
+    # items: the output pane's rows, ("text", str) or ("image", (digest, image bytes, ...)). Returns the files written.
+    with HtmlExporter(path, sidecar_images, page_size) as exporter:
+        for item_type, content in items:
+            if item_type == "text":
+                exporter.add_text(content)
+            elif item_type == "image":
+                exporter.add_image(content[1], content[0])
+    return exporter.files
@@ -0,0 +1,155 @@
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app.budget import count_tokens, MESSAGE_OVERHEAD_TOKENS
+from app.rate_limit import IMAGE_TOKEN_ESTIMATE
+from app.images import ProcessedImage, image_from_pil
+from app.processor import process_request, is_error_result
+
+# Chat history sent with "Include Chat History?": one entry per prompt/response turn, never status lines.
+# The most recent turns are kept verbatim within a token budget and a window; older ones are dropped or,
+# with a summarizer, folded into a running summary in the background. Defaults, can be adjusted:
+HISTORY_TOKEN_BUDGET = int(os.getenv("BATCH_PROCESSOR_HISTORY_TOKENS", "8000"))
+HISTORY_WINDOW = int(os.getenv("BATCH_PROCESSOR_HISTORY_TURNS", "20"))  # Turns kept verbatim
+SUMMARIZE_HISTORY = os.getenv("BATCH_PROCESSOR_SUMMARIZE_HISTORY", "0") == "1"
+SUMMARY_WORDS = 300
+
+SUMMARY_PROMPT = ("Update the summary of a conversation with the turns below. Keep the facts, decisions and results "
+                  "later requests may refer to, in at most {words} words. Reply with the summary only.\n\n"
+                  "Current summary:\n{summary}\n\nNew turns:\n{turns}")
+
+class Turn:
+    def __init__(self, prompt, text=None, images=None, source=None):
+        self.prompt = prompt
+        self.text = text
+        self.images = list(images or [])  # Base64 of processed images
+        self.source = source  # File the response is about, if any
+
+    def render(self):
+        parts = []
+        about = f" (file: {self.source})" if self.source else ""
+        if self.prompt:
+            parts.append(f"Prompt{about}: {self.prompt}")
+            about = ""
+        if self.text:
+            parts.append(f"Response{about}: {self.text}")
+        return "\n\n".join(parts)
+
+    def items(self):
+        items = [("text", self.render())] if self.prompt or self.text else []
+        return items + [("image", img_str) for img_str in self.images]
+
+    def tokens(self):
+        return count_tokens(self.render()) + MESSAGE_OVERHEAD_TOKENS + len(self.images) * IMAGE_TOKEN_ESTIMATE
+
+class HistoryManager:
+    # summarizer(summary, turns_text) returns the new summary text (or None to keep the old one), see make_summarizer
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, window=HISTORY_WINDOW, summarizer=None):
+        self.token_budget = token_budget
+        self.window = window
+        self.summarizer = summarizer
+        self.summary = ""
+        self._turns = deque()  # (turn, tokens), oldest first
+        self._tokens = 0
+        self._pending = []  # Turns out of the window, waiting to be folded into the summary
+        self._generation = 0  # Bumped by clear(), so a summary of cleared turns is thrown away
+        self._lock = threading.Lock()
+        self._executor = None
+        self._future = None
+
+    def add_turn(self, prompt, text=None, images=None, source=None):
+        turn = Turn(prompt, text, images, source)
+        tokens = turn.tokens()
+        with self._lock:
+            self._turns.append((turn, tokens))
+            self._tokens += tokens
+            # The newest turn always stays, even on its own over budget (the request is fitted to the model later)
+            while len(self._turns) > 1 and (len(self._turns) > self.window or self._tokens > self.token_budget):
+                evicted, evicted_tokens = self._turns.popleft()
+                self._tokens -= evicted_tokens
+                if self.summarizer is not None:
+                    self._pending.append(evicted)
+        self._schedule_summary()
+
+    def add_result(self, prompt, result, file_path=None):
+        # Records a process_request result as one turn; errors and unsupported results are left out
+        if is_error_result(result):
+            return
+        text, images = None, []
+        if isinstance(result, tuple):
+            text, image = result
+            images = [image]
+        elif isinstance(result, str):
+            text = result
+        else:
+            images = [result]
+        encoded = []
+        for image in images:
+            if image is None:
+                continue
+            processed = image if isinstance(image, ProcessedImage) else image_from_pil(image)
+            if processed is not None:
+                encoded.append(processed.base64)
+        if text or encoded:
+            self.add_turn(prompt, text, encoded, os.path.basename(file_path) if file_path else None)
+
+    def items(self):
+        # Snapshot in the (type, content) form the providers take: the summary first, then the kept turns in order
+        with self._lock:
+            items = [("text", f"Summary of the earlier conversation:\n{self.summary}")] if self.summary else []
+            for turn, _ in self._turns:
+                items.extend(turn.items())
+            return items
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._tokens = 0
+            self._pending = []
+            self.summary = ""
+            self._generation += 1
+
+    def __len__(self):
+        return len(self._turns)
+
+    def _schedule_summary(self):
+        with self._lock:
+            if not self._pending or self.summarizer is None or (self._future is not None and not self._future.done()):
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+            self._future = self._executor.submit(self._summarize)
+
+    def _summarize(self):
+        # Runs in the background; turns evicted meanwhile are picked up by the next run.
+        # Until it finishes, requests see the previous summary.
+        with self._lock:
+            pending, self._pending = self._pending, []
+            summary, generation, summarizer = self.summary, self._generation, self.summarizer
+        if summarizer is None:
+            return
+        turns_text = "\n\n".join(turn.render() for turn in pending)
+        try:
+            new_summary = summarizer(summary, turns_text)
+        except Exception as e:
+            print(f"Error summarizing chat history: {str(e)}", file=sys.stderr)
+            new_summary = None
+        with self._lock:
+            if new_summary and generation == self._generation:
+                self.summary = new_summary
+            self._future = None
+        self._schedule_summary()
+
+def make_summarizer(developer, model):
+    # A summarizer that asks the given model, for HistoryManager
+    def summarize(summary, turns_text):
+        result = process_request(developer, model, SUMMARY_PROMPT.format(words=SUMMARY_WORDS, summary=summary or "(none)", turns=turns_text), None)
+        if isinstance(result, tuple):
+            result = result[0]
+        if not isinstance(result, str) or is_error_result(result):
+            print(f"Chat history summary failed, keeping the previous one: {result}", file=sys.stderr)
+            return None
+        return result.strip()
+    return summarize
@@ -0,0 +1,296 @@
+import io
+import os
+import sys
+import base64
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+# Images are transcoded once (normalized to RGB, scaled down to 720p, JPEG) into a ProcessedImage.
+# Every consumer (provider payloads, Gemini's PIL input, the output pane, chat history) takes its view from that
+# object, and processed images are remembered by content hash so the same image is never transcoded twice.
+# Generated images (DALL-E) are model output rather than uploads: they are kept as full-size PNGs and only
+# transcoded if they are sent back to a model (e.g. from the chat history).
+MAX_IMAGE_SIZE = (1280, 720)  # 720p
+JPEG_QUALITY = 85
+
+# Target size and JPEG quality per developer, can be adjusted (e.g. larger for models that read fine print).
+# Images are never scaled up; anything not listed uses the defaults above.
+IMAGE_PROFILES = {
+    "ChatGPT": {"max_size": (1280, 720), "quality": 85},
+    "Claude": {"max_size": (1280, 720), "quality": 85},
+    "Gemini": {"max_size": (1280, 720), "quality": 85},
+}
+
+# Large images are decoded and resampled in a process pool, so image-heavy batches use every core.
+# Smaller ones are quicker to transcode in the calling thread than to ship to a worker.
+TRANSCODE_WORKERS = os.cpu_count() or 1
+POOL_MIN_BYTES = 512 * 1024
+
+IMAGE_CACHE_SIZE = 256 * 1024 * 1024  # Bytes of processed images (and their views) kept in memory, can be adjusted
+
+class ProcessedImage:
+    # The encoded image (JPEG, or PNG for generated images), with base64/PIL/Qt views created on first use and kept
+    def __init__(self, data, format="JPEG"):
+        self.data = data
+        self.format = format
+        self.digest = hashlib.sha256(data).hexdigest()
+        self._base64 = None
+        self._pil = None
+        self._qimage = None
+        self._dhash = None
+        self._lock = threading.Lock()
+
+    @property
+    def base64(self):
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode()
+        return self._base64
+
+    def pil(self):
+        # Shared, treat as read-only (copy() it before drawing on it)
+        with self._lock:
+            if self._pil is None:
+                image = Image.open(io.BytesIO(self.data))
+                image.load()
+                self._pil = image
+            return self._pil
+
+    def qimage(self):
+        from PyQt6.QtGui import QImage  # Only the UI needs Qt
+        with self._lock:
+            if self._qimage is None:
+                self._qimage = QImage.fromData(self.data, self.format)
+            return self._qimage
+
+    @property
+    def size(self):
+        return self.pil().size
+
+    def dhash(self):
+        # 64-bit difference hash: survives re-encoding, rescaling and small edits, so near-identical images collide
+        if self._dhash is None:
+            image = Image.open(io.BytesIO(self.data))
+            image.draft("L", (64, 64))  # JPEG can decode straight to a small grayscale image
+            pixels = list(image.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+            bits = 0
+            for row in range(8):
+                for col in range(8):
+                    bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+            self._dhash = bits
+        return self._dhash
+
+    def nbytes(self):
+        # Approximate memory held, for the cache budget
+        total = len(self.data) + (len(self._base64) if self._base64 else 0)
+        if self._pil is not None:
+            total += self._pil.width * self._pil.height * 3
+        if self._qimage is not None:
+            total += self._qimage.sizeInBytes()
+        return total
+
+_cache = OrderedDict()  # Source or processed content hash -> ProcessedImage, least recently used first
+_cache_lock = threading.Lock()
+# An image is held under up to two hashes; it counts against the budget once, while either key remains.
+# id(image) -> [image, keys holding it, bytes counted]. Sizes are taken when an image is added and refreshed
+# on each hit, so views created after that are picked up without summing the whole cache.
+_cache_refs = {}
+_cache_bytes = 0
+
+def _cache_retain(image):
+    global _cache_bytes
+    entry = _cache_refs.get(id(image))
+    if entry is None:
+        size = image.nbytes()
+        _cache_refs[id(image)] = [image, 1, size]
+        _cache_bytes += size
+    else:
+        entry[1] += 1
+
+def _cache_release(image):
+    global _cache_bytes
+    entry = _cache_refs[id(image)]
+    entry[1] -= 1
+    if entry[1] == 0:
+        del _cache_refs[id(image)]
+        _cache_bytes -= entry[2]
+
+def _cache_set(key, image):
+    old = _cache.get(key)
+    if old is not image:
+        if old is not None:
+            _cache_release(old)
+        _cache[key] = image
+        _cache_retain(image)
+    _cache.move_to_end(key)
+
+def _cache_get(digest):
+    global _cache_bytes
+    with _cache_lock:
+        image = _cache.get(digest)
+        if image is not None:
+            _cache.move_to_end(digest)
+            entry = _cache_refs[id(image)]
+            size = image.nbytes()
+            _cache_bytes += size - entry[2]
+            entry[2] = size
+        return image
+
+def _cache_put(digest, image):
+    with _cache_lock:
+        _cache_set(image.digest, image)  # Feeding processed output back in (e.g. from chat history) is a hit too
+        _cache_set(digest, image)
+        while _cache_bytes > IMAGE_CACHE_SIZE and len(_cache) > 2:
+            _, evicted = _cache.popitem(last=False)
+            _cache_release(evicted)
+
+def clear_image_cache():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_refs.clear()
+        _cache_bytes = 0
+
+def get_profile(profile=None):
+    # (max_size, quality) for a developer name from IMAGE_PROFILES, the defaults for anything else
+    settings = IMAGE_PROFILES.get(profile, {})
+    return tuple(settings.get("max_size", MAX_IMAGE_SIZE)), settings.get("quality", JPEG_QUALITY)
+
+def _transcode(image, preserve_original=False, max_size=MAX_IMAGE_SIZE, quality=JPEG_QUALITY):
+    # The normalization process_image has always applied, returning JPEG bytes
+    if not preserve_original:
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale directly; draft picks the smallest scale that still
+        # covers max_size, so a 20 MP photo is never decoded at full resolution just to be thumbnailed
+        if image.format == "JPEG":
+            image.draft("RGB", max_size)
+        # Convert image based on its mode
+        if image.mode in ['RGBA', 'LA']:
+            # Images with alpha channel
+            background = Image.new('RGBA', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])  # Last band is the alpha channel
+            image = background.convert('RGB')
+        elif image.mode == 'P':
+            # Palette images
+            image = image.convert('RGBA')
+            background = Image.new('RGBA', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            image = background.convert('RGB')
+        elif image.mode != 'RGB':
+            # All other modes (grayscale, CMYK, YCbCr, etc.)
+            image = image.convert('RGB')
+
+        # Resize the image if it's too large
+        image.thumbnail(max_size, Image.LANCZOS)
+
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+def _transcode_bytes(data, preserve_original, max_size, quality):
+    # Process pool entry point: encoded bytes in, JPEG bytes out (None if the image can't be decoded)
+    try:
+        return _transcode(Image.open(io.BytesIO(data)), preserve_original, max_size, quality)
+    except Exception as e:
+        print(f"Error processing image: {str(e)}", file=sys.stderr)
+        return None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_process_pool():
+    # One pool for the whole process (also used for PDF pages), started on first use.
+    # Workers are never forked from this process: it runs the Qt event loop and the batch threads, and a fork
+    # taken while another thread holds a lock can deadlock the child. forkserver where available, else spawn.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=TRANSCODE_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+def _use_pool(size):
+    # Worker processes transcode inline rather than start pools of their own
+    return size >= POOL_MIN_BYTES and TRANSCODE_WORKERS > 1 and multiprocessing.parent_process() is None
+
+
+def load_images(datas, preserve_original=False, profile=None):
+    # ProcessedImage (or None) for each of several encoded images; cache misses are transcoded in parallel
+    max_size, quality = get_profile(profile)
+    results = [None] * len(datas)
+    pending = {}
+    for i, data in enumerate(datas):
+        data = bytes(data)
+        content_digest = hashlib.sha256(data).hexdigest()
+        digest = hashlib.sha256(f"{content_digest}:{preserve_original}:{max_size}:{quality}".encode()).hexdigest()
+        # Output of an earlier transcode (e.g. an image from the chat history) is used as it is;
+        # a generated PNG found under its own hash is still transcoded like any other upload
+        image = _cache_get(content_digest)
+        if image is None or image.format != "JPEG":
+            image = _cache_get(digest)
+        if image is not None:
+            results[i] = image
+        elif digest in pending:
+            pending[digest][1].append(i)  # Same image twice in this call, transcoded once
+        elif _use_pool(len(data)):
+            future = get_process_pool().submit(_transcode_bytes, data, preserve_original, max_size, quality)
+            pending[digest] = (future, [i])
+        else:
+            pending[digest] = (_transcode_bytes(data, preserve_original, max_size, quality), [i])
+
+    for digest, (result, indexes) in pending.items():
+        try:
+            jpeg = result.result() if hasattr(result, "result") else result
+        except Exception as e:
+            print(f"Error processing image: {str(e)}", file=sys.stderr)
+            jpeg = None
+        if jpeg is None:
+            continue
+        image = ProcessedImage(jpeg)
+        _cache_put(digest, image)
+        for i in indexes:
+            results[i] = image
+    return results
+
+def load_image(image_path_or_bytes, preserve_original=False, profile=None):
+    # ProcessedImage for a file path or encoded image bytes, or None if it can't be decoded
+    try:
+        if isinstance(image_path_or_bytes, str):
+            with open(image_path_or_bytes, "rb") as image_file:
+                data = image_file.read()
+        else:
+            data = image_path_or_bytes
+    except Exception as e:
+        print(f"Error processing image: {str(e)}", file=sys.stderr)
+        return None
+    return load_images([data], preserve_original, profile)[0]
+
+def image_from_base64(img_str, processed=False):
+    # Base64 produced by ProcessedImage.base64 comes straight back from the cache; anything else is processed once.
+    # processed=True wraps output of an earlier process_image (e.g. from the extraction cache) without transcoding it again.
+    if not processed:
+        return load_image(base64.b64decode(img_str))
+    data = base64.b64decode(img_str)
+    image = _cache_get(hashlib.sha256(data).hexdigest())
+    if image is None:
+        image = ProcessedImage(data)
+        image._base64 = img_str
+        _cache_put(image.digest, image)
+    return image
+
+def image_from_pil(pil_image):
+    # Generated images (DALL-E) arrive as PIL objects; kept at full size as a lossless PNG, cached by their pixels
+    try:
+        digest = hashlib.sha256(pil_image.tobytes() + repr((pil_image.mode, pil_image.size)).encode()).hexdigest()
+        image = _cache_get(digest)
+        if image is None:
+            buffered = io.BytesIO()
+            pil_image.save(buffered, format="PNG")
+            image = ProcessedImage(buffered.getvalue(), "PNG")
+            _cache_put(digest, image)
+        return image
+    except Exception as e:
+        print(f"Error processing image: {str(e)}", file=sys.stderr)
+        return None
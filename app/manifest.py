@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from app.utils import file_digest
+
+# Checkpoints for batch jobs live here, one directory per job, can be moved with BATCH_PROCESSOR_JOBS_DIR
+JOBS_DIR = os.getenv("BATCH_PROCESSOR_JOBS_DIR", os.path.join(os.path.expanduser("~"), ".batch-processor", "jobs"))
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+def job_id_for(directory, developer, model, prompt, context_files=None):
+    # The same directory/prompt/model/context always maps to the same job, so re-running it resumes
+    key = json.dumps({
+        "directory": os.path.abspath(directory),
+        "developer": developer,
+        "model": model,
+        "prompt": prompt,
+        "context": sorted(os.path.abspath(f) for f in context_files or []),
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+class JobManifest:
+    # Per-job record of every file's status, input hash and output location.
+    # manifest.json is a snapshot; each status change is appended to journal.jsonl (one small write per file
+    # instead of rewriting the whole manifest) and folded back into the snapshot when the job is reopened.
+    def __init__(self, job_dir, info=None):
+        self.job_dir = job_dir
+        self.info = info or {}
+        self.files = {}
+        self.state = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(job_dir, "outputs"), exist_ok=True)
+        self._load()
+        self._compact()
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+
+    @classmethod
+    def open_job(cls, directory, developer, model, prompt, file_paths, context_files=None, jobs_dir=JOBS_DIR, restart=False):
+        job_id = job_id_for(directory, developer, model, prompt, context_files)
+        manifest = cls(os.path.join(jobs_dir, job_id), info={
+            "job_id": job_id,
+            "directory": os.path.abspath(directory),
+            "developer": developer,
+            "model": model,
+            "prompt": prompt,
+        })
+        if restart:
+            manifest.reset()
+        manifest.add_files(file_paths)
+        return manifest
+
+    @property
+    def job_id(self):
+        return self.info.get("job_id")
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.job_dir, "manifest.json")
+
+    @property
+    def _journal_path(self):
+        return os.path.join(self.job_dir, "journal.jsonl")
+
+    def _load(self):
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.info = {**snapshot.get("info", {}), **self.info}
+            self.files = snapshot.get("files", {})
+            self.state = snapshot.get("state", {})
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        update = json.loads(line)
+                    except ValueError:
+                        break  # Torn last line from a crash, everything before it is intact
+                    if "state" in update:
+                        self.state.update(update["state"])
+                    else:
+                        self.files[update["file"]] = update["entry"]
+
+    def _compact(self):
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"info": self.info, "state": self.state, "files": self.files}, f)
+        os.replace(tmp_path, self._manifest_path)
+        open(self._journal_path, "w").close()
+
+    def _update(self, file_path, **changes):
+        with self._lock:
+            entry = dict(self.files.get(file_path, {"status": PENDING, "attempts": 0}))
+            entry.update(changes, updated=time.time())
+            self.files[file_path] = entry
+            self._journal.write(json.dumps({"file": file_path, "entry": entry}) + "\n")
+            self._journal.flush()
+
+    def update_state(self, **state):
+        # Job-level state (e.g. submitted bulk batches) that must survive a restart
+        with self._lock:
+            self.state.update(state)
+            self._journal.write(json.dumps({"state": state}) + "\n")
+            self._journal.flush()
+
+    def reset(self):
+        with self._lock:
+            self.files = {}
+            self.state = {}
+            self._compact()
+
+    def add_files(self, file_paths):
+        for file_path in file_paths:
+            if file_path not in self.files:
+                self._update(file_path, status=PENDING)
+
+    def _input_changed(self, file_path, entry):
+        # mtime/size first; the file is only re-hashed if those moved
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return True
+        if (stat.st_mtime_ns, stat.st_size) == (entry.get("mtime_ns"), entry.get("size")):
+            return False
+        return stat.st_size != entry.get("size") or file_digest(file_path) != entry.get("input_hash")
+
+    def pending_files(self, file_paths):
+        # Files that still need a request: never completed, failed, or changed since they were completed
+        return [f for f in file_paths if self.files.get(f, {}).get("status") != DONE or self._input_changed(f, self.files[f])]
+
+    def completed_files(self, file_paths):
+        pending = set(self.pending_files(file_paths))
+        return [f for f in file_paths if f not in pending]
+
+    def record_result(self, file_path, record):
+        # record is a records.result_to_record dict; it is written to outputs/ and the manifest points at it
+        try:
+            stat = os.stat(file_path)
+            input_hash, mtime_ns, size = file_digest(file_path), stat.st_mtime_ns, stat.st_size
+        except OSError:
+            input_hash, mtime_ns, size = None, None, None  # Removed while it was being processed
+        output_name = hashlib.sha256(file_path.encode()).hexdigest()[:16] + ".json"
+        output_path = os.path.join(self.job_dir, "outputs", output_name)
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, output_path)
+        attempts = self.files.get(file_path, {}).get("attempts", 0) + 1
+        if record["status"] == "ok":
+            self._update(file_path, status=DONE, input_hash=input_hash, mtime_ns=mtime_ns, size=size,
+                         output=output_path, error=None, attempts=attempts)
+        else:
+            self._update(file_path, status=FAILED, input_hash=input_hash, mtime_ns=mtime_ns, size=size,
+                         output=output_path, error=record.get("text"), attempts=attempts)
+
+    def load_output(self, file_path):
+        output_path = self.files.get(file_path, {}).get("output")
+        if not output_path or not os.path.exists(output_path):
+            return None
+        with open(output_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def counts(self):
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        for entry in self.files.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
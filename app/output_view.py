@@ -0,0 +1,225 @@
+import io
+from collections import OrderedDict
+from PIL import Image
+from PyQt6.QtWidgets import QListView, QStyledItemDelegate, QStyle, QApplication, QAbstractItemView
+from PyQt6.QtGui import QPixmap, QPixmapCache, QImage, QKeySequence, QColor
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QRect
+
+# The output pane as a model/view list rather than two QLabels per message: results are kept as plain data
+# (text, JPEG bytes) and only the rows on screen are painted, so memory and repaint cost stay flat however many
+# results accumulate. Image thumbnails are decoded on first paint and kept in Qt's pixmap cache.
+# With a ResultsStore, result rows only hold database ids and their text and images are read back when needed.
+THUMBNAIL_SIZE = (400, 300)
+THUMBNAIL_CACHE_KB = 64 * 1024  # Can be adjusted; thumbnails scrolled out of view are decoded again when evicted
+MAX_DISPLAY_CHARS = 20000  # Longer texts are shown cut (Copy and Save Output still get all of it)
+TEXT_CACHE_ITEMS = 512  # Stored result texts kept in memory for painting
+ITEM_PADDING = 6
+SEPARATOR_HEIGHT = 9  # Room for the line between items, where the "---" labels used to be
+
+KIND_ROLE = Qt.ItemDataRole.UserRole
+IMAGE_ROLE = Qt.ItemDataRole.UserRole + 1  # (digest, thumbnail size)
+DATA_ROLE = Qt.ItemDataRole.UserRole + 2  # Encoded image bytes
+
+def thumbnail_size(width, height):
+    scale = min(THUMBNAIL_SIZE[0] / width, THUMBNAIL_SIZE[1] / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+class OutputModel(QAbstractListModel):
+    # Rows are ("text", str), ("image", (digest, image bytes, thumbnail size)) or, read from the store,
+    # ("result", result id) and ("stored_image", (digest, image id, thumbnail size))
+    def __init__(self, store=None, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self._items = []
+        self._texts = OrderedDict()  # result id -> text, least recently used first
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._items)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._items):
+            return None
+        kind, value = self._items[index.row()]
+        if role == KIND_ROLE:
+            return "image" if kind in ("image", "stored_image") else "text"
+        if role == IMAGE_ROLE and kind in ("image", "stored_image"):
+            return value[0], value[2]
+        if role == DATA_ROLE and kind == "image":
+            return value[1]
+        if role == DATA_ROLE and kind == "stored_image":
+            return self.store.image(value[1])
+        if role == Qt.ItemDataRole.DisplayRole and kind == "text":
+            return value
+        if role == Qt.ItemDataRole.DisplayRole and kind == "result":
+            return self._stored_text(value)
+        return None
+
+    def _stored_text(self, result_id):
+        if result_id in self._texts:
+            self._texts.move_to_end(result_id)
+            return self._texts[result_id]
+        text = self.store.text(result_id) or ""
+        self._texts[result_id] = text
+        if len(self._texts) > TEXT_CACHE_ITEMS:
+            self._texts.popitem(last=False)
+        return text
+
+    def _resolve(self, item):
+        # Stored rows read back in the inline form, without touching the paint cache (may run on another thread)
+        kind, value = item
+        if kind == "result":
+            return "text", self.store.text(value) or ""
+        if kind == "stored_image":
+            return "image", (value[0], self.store.image(value[1]), value[2])
+        return item
+
+    def items(self):
+        # A snapshot of the rows, each read from the store as it is consumed
+        rows = list(self._items)
+        return (self._resolve(item) for item in rows)
+
+    def append_text(self, text):
+        return self._append(("text", text))
+
+    def append_image(self, processed):
+        # processed: a ProcessedImage; only its encoded bytes are kept, not its decoded views
+        width, height = Image.open(io.BytesIO(processed.data)).size  # Reads the header only
+        return self._append(("image", (processed.digest, processed.data, thumbnail_size(width, height))))
+
+    def append_result(self, result_id):
+        return self._append(("result", result_id))
+
+    def append_stored_image(self, image_id, digest, width, height):
+        return self._append(("stored_image", (digest, image_id, thumbnail_size(width, height))))
+
+    def set_result(self, row, result_id):
+        # A streamed row is replaced by the stored result once it is complete
+        self._items[row] = ("result", result_id)
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def find(self, query, start=0, session_id=None):
+        # The first row at or after start (wrapping around) whose text contains query, or None
+        query = query.lower()
+        matches = set(self.store.search(query, session_id)) if self.store is not None else set()
+        for offset in range(len(self._items)):
+            row = (start + offset) % len(self._items)
+            kind, value = self._items[row]
+            if (kind == "result" and value in matches) or (kind == "text" and query in value.lower()):
+                return row
+        return None
+
+    def _append(self, item):
+        row = len(self._items)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._items.append(item)
+        self.endInsertRows()
+        return row
+
+    def set_text(self, row, text):
+        self._items[row] = ("text", text)
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._items[row]
+        self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._items = []
+        self._texts.clear()
+        self.endResetModel()
+
+class OutputDelegate(QStyledItemDelegate):
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self._heights = {}  # row -> (width, text height); laying out a long text is the expensive part
+
+    def forget(self, row=None):
+        if row is None:
+            self._heights.clear()
+        else:
+            self._heights.pop(row, None)
+
+    def _text_width(self):
+        return max(50, self.view.viewport().width() - 2 * ITEM_PADDING)
+
+    @staticmethod
+    def _display_text(text):
+        if len(text) <= MAX_DISPLAY_CHARS:
+            return text
+        return text[:MAX_DISPLAY_CHARS] + f"\n\n[... {len(text) - MAX_DISPLAY_CHARS} more characters, copy the item or save the output to see all of it]"
+
+    def sizeHint(self, option, index):
+        width = self._text_width()
+        if index.data(KIND_ROLE) == "image":
+            _, (thumb_width, thumb_height) = index.data(IMAGE_ROLE)
+            return QSize(width, thumb_height + 2 * ITEM_PADDING + SEPARATOR_HEIGHT)
+        cached = self._heights.get(index.row())
+        if cached is None or cached[0] != width:
+            text = self._display_text(index.data() or "")
+            rect = option.fontMetrics.boundingRect(QRect(0, 0, width, 1 << 24), Qt.TextFlag.TextWordWrap, text)
+            cached = self._heights[index.row()] = (width, rect.height())
+        return QSize(width, cached[1] + 2 * ITEM_PADDING + SEPARATOR_HEIGHT)
+
+    def thumbnail(self, index):
+        digest, size = index.data(IMAGE_ROLE)
+        pixmap = QPixmapCache.find(digest)
+        if pixmap is None or pixmap.isNull():
+            data = index.data(DATA_ROLE)  # Only read (possibly from the store) when the thumbnail isn't cached
+            pixmap = QPixmap.fromImage(QImage.fromData(data or b"")).scaled(
+                size[0], size[1], Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+            QPixmapCache.insert(digest, pixmap)
+        return pixmap
+
+    def paint(self, painter, option, index):
+        painter.save()
+        selected = bool(option.state & QStyle.StateFlag.State_Selected)
+        if selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+        content = option.rect.adjusted(ITEM_PADDING, ITEM_PADDING, -ITEM_PADDING, -ITEM_PADDING - SEPARATOR_HEIGHT)
+        if index.data(KIND_ROLE) == "image":
+            painter.drawPixmap(content.topLeft(), self.thumbnail(index))
+        else:
+            painter.setPen(option.palette.highlightedText().color() if selected else option.palette.text().color())
+            painter.drawText(content, Qt.TextFlag.TextWordWrap, self._display_text(index.data() or ""))
+        painter.setPen(QColor("#ddd"))
+        line_y = option.rect.bottom() - SEPARATOR_HEIGHT // 2
+        painter.drawLine(option.rect.left() + ITEM_PADDING, line_y, option.rect.right() - ITEM_PADDING, line_y)
+        painter.restore()
+
+class OutputView(QListView):
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        QPixmapCache.setCacheLimit(THUMBNAIL_CACHE_KB)
+        self.setModel(model)
+        self.delegate = OutputDelegate(self)
+        self.setItemDelegate(self.delegate)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setResizeMode(QListView.ResizeMode.Adjust)  # Re-wrap text when the window is resized
+        self.setLayoutMode(QListView.LayoutMode.Batched)  # Lay out a long list in steps, without blocking the UI
+        self.setBatchSize(200)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        model.dataChanged.connect(self.on_data_changed)
+        model.modelReset.connect(lambda: self.delegate.forget())
+        model.rowsRemoved.connect(lambda parent, first, last: self.delegate.forget())
+
+    def on_data_changed(self, top_left, bottom_right):
+        # A streaming row grows as text arrives; its height is measured again
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            self.delegate.forget(row)
+            self.delegate.sizeHintChanged.emit(self.model().index(row))
+
+    def keyPressEvent(self, event):
+        # QLabels allowed selecting text; here Ctrl+C copies the selected items
+        if event.matches(QKeySequence.StandardKey.Copy):
+            rows = sorted(index.row() for index in self.selectedIndexes())
+            texts = [self.model().index(row).data() for row in rows]
+            QApplication.clipboard().setText("\n\n".join(text for text in texts if text))
+            return
+        super().keyPressEvent(event)
@@ -1,142 +1,230 @@
 import os
-import base64
+import sys
 from dotenv import load_dotenv
-from openai import OpenAI
-import google.generativeai as genai
-from anthropic import Anthropic
-from mistralai.client import MistralClient
 from mistralai.models.chat_completion import ChatMessage
-from app.utils import read_file, read_context_files
+from app.clients import get_openai_client, get_anthropic_client, get_gemini_model, get_mistral_client
+from app.utils import read_file
+from app.context import prepare_context
+from app.rate_limit import call_with_rate_limit, estimate_tokens, prime_stream
+from app.usage import usage_stats, record_openai_usage, record_anthropic_usage, record_gemini_usage, record_mistral_usage
+from app.budget import plan_request
+from app import response_cache
 from app.read_files import read_document
 import requests
 from PIL import Image
 from io import BytesIO
 from .read_files import process_image # Pre-process all images into JPG format
+from app.images import load_image, image_from_base64
 
 
 load_dotenv()
 
-def process_request(developer, model, prompt, file_path, chat_history=None, context_files=None):
-    if chat_history:
-        history_prompt = "\n".join([
-            item_content if item_type == "text" else f"[Image: Base64 encoded, starts with {item_content[:20]}...]"
-            for item_type, item_content in chat_history
-        ])
-        prompt = f"{history_prompt}\n\nNew prompt: {prompt}"
+# Provider functions report failures as text; these prefixes let callers tell them apart from model output
+ERROR_PREFIXES = ("Error processing", "Error generating", "Error transcribing", "Invalid developer selected")
 
-    if context_files:
-        context_content = read_context_files(context_files)
-        prompt = f"Context:{context_content}\n\nPrompt:\n{prompt}"
+def is_error_result(result):
+    return isinstance(result, str) and result.startswith(ERROR_PREFIXES)
 
+# Response length limits, shared with bulk mode
+CHATGPT_MAX_TOKENS = 12000
+CLAUDE_MAX_TOKENS = 4000
+GEMINI_MAX_TOKENS = 8000
+MISTRAL_MAX_TOKENS = 4000
+
+GEMINI_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 64,
+    "max_output_tokens": GEMINI_MAX_TOKENS
+}
+
+# Settings other than the prompt that change a developer's response, part of the response cache key
+GENERATION_PARAMS = {
+    "ChatGPT": {"max_tokens": CHATGPT_MAX_TOKENS},
+    "Claude": {"max_tokens": CLAUDE_MAX_TOKENS},
+    "Gemini": GEMINI_GENERATION_CONFIG,
+    "Mistral": {"max_tokens": MISTRAL_MAX_TOKENS},
+}
+
+# Requests are laid out as a prefix shared by the whole batch (history, context files, prompt) followed by the
+# per-file content, so providers can serve the prefix from their prompt cache. Anthropic only caches what is
+# explicitly marked and needs at least ~1024 tokens; smaller prefixes aren't marked (a cache write costs extra).
+CACHE_MIN_TOKENS = 1024
+
+def build_prompt(prompt, context_files=None):
+    # Returns the prompt text and the prepared context bundle. Chat history is not added to the prompt:
+    # each provider sends it as messages of its own, so it is only included once.
+
+    # Extracted once and reused by every request in a batch. Each provider renders the context files itself,
+    # ahead of the prompt, so they are not repeated in the prompt text.
+    context_files = prepare_context(context_files)
+    return prompt, context_files
+
+def fit_request(model, max_output_tokens, prompt, file_path, chat_history=None, context_files=None, file_text="", file_images=None, prompt_copies=1):
+    # Fits history, context and file content into the model's context window before anything is sent (see app/budget.py)
+    plan = plan_request(model, max_output_tokens, prompt, chat_history, context_files, file_text, file_images, prompt_copies)
+    if plan.trimmed:
+        print(f"{file_path or 'Prompt'} is too large for {model} ({plan.limit} tokens): " + ", ".join(plan.notes), file=sys.stderr)
+    return plan
+
+def process_request(developer, model, prompt, file_path, chat_history=None, context_files=None, on_token=None, file_text=None):
+    # on_token, if given, switches to the provider's streaming API and is called with each piece of text as it arrives.
+    # The complete response is still returned at the end.
+    # file_text, if given, is sent as the file's content instead of reading file_path (e.g. one chunk of a long document).
+    # With the response cache on (app/response_cache.py), a request identical to an earlier one is answered from disk.
+    prompt, context_files = build_prompt(prompt, context_files)
+
+    cache_key = None
+    if response_cache.RESPONSE_CACHE_ENABLED and developer in GENERATION_PARAMS:
+        cache_key = response_cache.response_cache_key(developer, model, GENERATION_PARAMS[developer], prompt, file_path,
+                                                      chat_history, context_files, file_text)
+    if cache_key:
+        cached = response_cache.cached_response(cache_key)
+        if cached is not None:
+            if on_token:
+                on_token(cached)
+            return cached
+    result = _dispatch_request(developer, model, prompt, file_path, chat_history, context_files, on_token, file_text)
+    if cache_key and not is_error_result(result):
+        response_cache.cache_response(cache_key, result)
+    return result
+
+def _dispatch_request(developer, model, prompt, file_path, chat_history=None, context_files=None, on_token=None, file_text=None):
     if developer == "ChatGPT":
-        return process_chatgpt(model, prompt, file_path, chat_history, context_files)
+        return process_chatgpt(model, prompt, file_path, chat_history, context_files, on_token, file_text)
     elif developer == "Claude":
-        return process_claude(model, prompt, file_path, chat_history, context_files)
+        return process_claude(model, prompt, file_path, chat_history, context_files, on_token, file_text)
     elif developer == "Gemini":
-        return process_gemini(model, prompt, file_path, chat_history, context_files)
+        return process_gemini(model, prompt, file_path, chat_history, context_files, on_token, file_text)
     elif developer == "Mistral":
-        return process_mistral(model, prompt, file_path, chat_history, context_files)        
+        return process_mistral(model, prompt, file_path, chat_history, context_files, on_token, file_text)        
     else:
         return "Invalid developer selected"
 
-def process_chatgpt(model, prompt, file_path, chat_history=None, context_files=None):
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
+def build_chatgpt_messages(model, prompt, file_path, chat_history=None, context_files=None, file_text=None):
+    # The messages process_chatgpt sends (bulk mode submits the same payload). Raises if the file can't be read.
+    file_images = []
+    if file_text is None and file_path and not file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+        # Only gpt-4 models take images, the others get the text-only extraction
+        file_text, file_images = read_file(file_path, include_images=model.startswith("gpt-4"), image_profile="ChatGPT")
+    # The prompt is sent twice, once with the file
+    plan = fit_request(model, CHATGPT_MAX_TOKENS, prompt, file_path, chat_history, context_files, file_text, file_images, prompt_copies=2)
+
     messages = []
-    if chat_history:
-        for item_type, item_content in chat_history:
+    if plan.chat_history:
+        for item_type, item_content in plan.chat_history:
             if item_type == "text":
                 messages.append({"role": "user", "content": item_content})
             elif item_type == "image":
-                processed_image = process_image(base64.b64decode(item_content))
+                processed_image = image_from_base64(item_content)  # Already processed images come from the cache
                 if processed_image:
                     messages.append({
                         "role": "user",
                         "content": [
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{processed_image}"}}
+                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{processed_image.base64}"}}
                         ]
                     })
 
-    if context_files:
+    if plan.context_entries:
         context_message = "Context Files:\n"
-        for context_file in context_files:
-            try:
-                if context_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                    with open(context_file, "rb") as image_file:
-                        image_bytes = image_file.read()
-                    processed_image = process_image(image_bytes)
-                    if processed_image and model.startswith("gpt-4"):
-                        messages.append({
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": f"Context image: {os.path.basename(context_file)}"
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{processed_image}"
-                                    }
-                                }
-                            ]
-                        })
-                    else:
-                        context_message += f"[An image file was provided: {os.path.basename(context_file)}]\n"
-                else:
-                    file_content = read_file(context_file)
-                    context_message += f"Content of context file {os.path.basename(context_file)}:\n{file_content}\n\n"
-            except Exception as e:
-                context_message += f"Error reading context file {os.path.basename(context_file)}: {str(e)}\n"
-        context_message += "End of Context Files\n"
-        messages.append({"role": "user", "content": context_message})
-
-    messages.append({"role": "user", "content": f"Prompt:\n{prompt}"})
-    
-    if file_path:
-        try:
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                with open(file_path, "rb") as image_file:
-                    image_bytes = image_file.read()
-                processed_image = process_image(image_bytes)
-                if processed_image and model.startswith("gpt-4"):
+        for entry in plan.context_entries:
+            if entry.kind == "image":
+                if entry.images and model.startswith("gpt-4"):
                     messages.append({
                         "role": "user",
                         "content": [
                             {
                                 "type": "text",
-                                "text": prompt
+                                "text": f"Context image: {entry.name}"
                             },
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{processed_image}"
+                                    "url": f"data:image/jpeg;base64,{entry.images[0]}"
                                 }
                             }
                         ]
                     })
                 else:
-                    print(f"Failed to process image file: {file_path}")  # Added error logging
-                    messages.append({"role": "user", "content": f"{prompt}\n\n[An image was shared but could not be processed or the model doesn't support image analysis.]"})
+                    context_message += f"[An image file was provided: {entry.name}]\n"
+            elif entry.kind == "document":
+                context_message += f"Content of context file {entry.name}:\n{entry.text}\n\n"
+                if entry.images and model.startswith("gpt-4"):
+                    messages.append({
+                        "role": "user",
+                        "content": [{"type": "text", "text": f"Images from context file: {entry.name}"}] + [
+                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_str}"}}
+                            for img_str in entry.images
+                        ]
+                    })
             else:
-                file_content = read_file(file_path)
-                messages.append({"role": "user", "content": f"{prompt}\n\nFile content: {file_content}"})
-        except Exception as e:
-            print(f"Error processing file {file_path}: {str(e)}")  # Added error logging
-            return f"Error processing file {file_path}: {str(e)}"
+                context_message += f"Error reading context file {entry.name}: {entry.error}\n"
+        context_message += "End of Context Files\n"
+        messages.append({"role": "user", "content": context_message})
+
+    messages.append({"role": "user", "content": f"Prompt:\n{prompt}"})
+
+    # Everything above is identical for every file of a batch (OpenAI caches matching prefixes automatically);
+    # only the messages below vary
+    if file_path:
+        if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+            with open(file_path, "rb") as image_file:
+                image_bytes = image_file.read()
+            processed_image = process_image(image_bytes, profile="ChatGPT")
+            if processed_image and model.startswith("gpt-4"):
+                messages.append({
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{processed_image}"
+                            }
+                        }
+                    ]
+                })
+            else:
+                print(f"Failed to process image file: {file_path}", file=sys.stderr)  # Added error logging
+                messages.append({"role": "user", "content": f"{prompt}\n\n[An image was shared but could not be processed or the model doesn't support image analysis.]"})
+        else:
+            file_text, file_images = plan.file_text, plan.file_images
+            if file_images:
+                messages.append({
+                    "role": "user",
+                    "content": [{"type": "text", "text": f"{prompt}\n\nFile content: {file_text}"}] + [
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_str}"}}
+                        for img_str in file_images
+                    ]
+                })
+            else:
+                messages.append({"role": "user", "content": f"{prompt}\n\nFile content: {file_text}"})
     else:
         messages.append({"role": "user", "content": prompt})
 
+    return messages
+
+def process_chatgpt(model, prompt, file_path, chat_history=None, context_files=None, on_token=None, file_text=None):
+    client = get_openai_client()
+    
+    try:
+        messages = build_chatgpt_messages(model, prompt, file_path, chat_history, context_files, file_text)
+    except Exception as e:
+        print(f"Error processing file {file_path}: {str(e)}", file=sys.stderr)  # Added error logging
+        return f"Error processing file {file_path}: {str(e)}"
 
     if model in ["dall-e-3", "dall-e-2"]:
         try:
-            response = client.images.generate(
+            response = call_with_rate_limit("ChatGPT", model, lambda: client.images.generate(
                 model=model,
                 prompt=messages[-1]["content"],
                 size = "512x512" if model == "dall-e-2" else "1024x1024",  # Default for DALL-E 3
                 quality="standard",
                 n=1,
-            )
+            ))
             image_url = response.data[0].url
             image_response = requests.get(image_url)
             image = Image.open(BytesIO(image_response.content))
@@ -147,156 +235,237 @@ def process_chatgpt(model, prompt, file_path, chat_history=None, context_files=N
     
     elif model == "whisper-1":
         try:
-            with open(file_path, "rb") as audio_file:
-                transcription = client.audio.transcriptions.create(
-                    model=model,
-                    file=audio_file
-                )
+            def transcribe():
+                with open(file_path, "rb") as audio_file:
+                    return client.audio.transcriptions.create(
+                        model=model,
+                        file=audio_file
+                    )
+            transcription = call_with_rate_limit("ChatGPT", model, transcribe)
             return f"Transcription of {os.path.basename(file_path)}:\n\n{transcription.text}"
         except Exception as e:
             return f"Error transcribing audio file: {str(e)}"
     else:
+        # OpenAI counts max_tokens against the tokens-per-minute quota up front
+        estimated_tokens = estimate_tokens(messages) + CHATGPT_MAX_TOKENS
         try:
-            response = client.chat.completions.create(
+            if on_token:
+                stream = call_with_rate_limit("ChatGPT", model, lambda: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=CHATGPT_MAX_TOKENS,
+                    stream=True,
+                    extra_body={"stream_options": {"include_usage": True}}
+                ), estimated_tokens)
+                parts = []
+                for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        record_openai_usage(chunk.usage)  # Final chunk, no choices
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        on_token(delta)
+                return "".join(parts).strip()
+
+            response = call_with_rate_limit("ChatGPT", model, lambda: client.chat.completions.create(
                 model=model,
                 messages=messages,
-                max_tokens=12000
-            )
+                max_tokens=CHATGPT_MAX_TOKENS
+            ), estimated_tokens)
+            record_openai_usage(response.usage)
             return response.choices[0].message.content.strip()
         
         except Exception as e:
             return f"Error processing request: {str(e)}"
 
-def process_claude(model, prompt, file_path, chat_history=None, context_files=None):
-    client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    
+def build_claude_content(model, prompt, file_path, chat_history=None, context_files=None, file_text=None):
+    # The user message content process_claude sends (bulk mode submits the same payload). Raises if the file can't be read.
+    file_images = []
+    if file_text is None and file_path and not file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+        file_text, file_images = read_file(file_path, image_profile="Claude")
+    plan = fit_request(model, CLAUDE_MAX_TOKENS, prompt, file_path, chat_history, context_files, file_text, file_images)
+
     content = []
-    if chat_history:
-        for item_type, item_content in chat_history:
+    if plan.chat_history:
+        for item_type, item_content in plan.chat_history:
             if item_type == "text":
                 content.append({"type": "text", "text": item_content})
             elif item_type == "image":
-                processed_image = process_image(base64.b64decode(item_content))
+                processed_image = image_from_base64(item_content)  # Already processed images come from the cache
                 if processed_image:
                     content.append({
                         "type": "image",
                         "source": {
                             "type": "base64",
                             "media_type": "image/jpeg",
-                            "data": processed_image
+                            "data": processed_image.base64
                         }
                     })
     
-    if context_files:
+    if plan.context_entries:
         content.append({"type": "text", "text": "Context Files:"})
-        for context_file in context_files:
-            try:
-                if context_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                    with open(context_file, "rb") as image_file:
-                        image_bytes = image_file.read()
-                    processed_image = process_image(image_bytes)
-                    if processed_image:
-                        content.append({
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": processed_image
-                            }
-                        })
-                        content.append({"type": "text", "text": f"Context image: {os.path.basename(context_file)}"})
-                    else:
-                        content.append({"type": "text", "text": f"[Failed to process image file: {os.path.basename(context_file)}]"})
-                else:
-                    file_content = read_file(context_file)
-                    content.append({"type": "text", "text": f"Content of context file {os.path.basename(context_file)}:\n\n{file_content}"})
-            except Exception as e:
-                content.append({"type": "text", "text": f"Error reading context file {os.path.basename(context_file)}: {str(e)}"})
-        content.append({"type": "text", "text": "End of Context Files"})
-    
-    content.append({"type": "text", "text": f"Prompt:\n{prompt}"})
-
-    if file_path:
-        try:
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                with open(file_path, "rb") as image_file:
-                    image_bytes = image_file.read()
-                processed_image = process_image(image_bytes)
-                if processed_image:
+        for entry in plan.context_entries:
+            if entry.kind == "image":
+                if entry.images:
                     content.append({
                         "type": "image",
                         "source": {
                             "type": "base64",
                             "media_type": "image/jpeg",
-                            "data": processed_image
+                            "data": entry.images[0]
                         }
                     })
-                    content.append({"type": "text", "text": "Please analyze this image based on the given prompt."})
+                    content.append({"type": "text", "text": f"Context image: {entry.name}"})
                 else:
-                    content.append({"type": "text", "text": "[An image was shared but could not be processed.]"})
+                    content.append({"type": "text", "text": f"[Failed to process image file: {entry.name}]"})
+            elif entry.kind == "document":
+                content.append({"type": "text", "text": f"Content of context file {entry.name}:\n\n{entry.text}"})
+                for img_str in entry.images:
+                    content.append({
+                        "type": "image",
+                        "source": {
+                            "type": "base64",
+                            "media_type": "image/jpeg",
+                            "data": img_str
+                        }
+                    })
             else:
-                file_content = read_file(file_path)
-                content.append({"type": "text", "text": f"Here's the content of the file {os.path.basename(file_path)}:\n\n{file_content}\n\nPlease analyze this content based on the given prompt."})
-        except Exception as e:
-            return f"Error processing file {file_path}: {str(e)}"
+                content.append({"type": "text", "text": f"Error reading context file {entry.name}: {entry.error}"})
+        content.append({"type": "text", "text": "End of Context Files"})
+    
+    content.append({"type": "text", "text": f"Prompt:\n{prompt}"})
+
+    # Cache breakpoint: the blocks up to here are shared by every file of a batch, the ones after vary
+    if file_path and estimate_tokens(content) >= CACHE_MIN_TOKENS:
+        content[-1]["cache_control"] = {"type": "ephemeral"}
+
+    if file_path:
+        if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+            with open(file_path, "rb") as image_file:
+                image_bytes = image_file.read()
+            processed_image = process_image(image_bytes, profile="Claude")
+            if processed_image:
+                content.append({
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": "image/jpeg",
+                        "data": processed_image
+                    }
+                })
+                content.append({"type": "text", "text": "Please analyze this image based on the given prompt."})
+            else:
+                content.append({"type": "text", "text": "[An image was shared but could not be processed.]"})
+        else:
+            file_text, file_images = plan.file_text, plan.file_images
+            for img_str in file_images:
+                content.append({
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": "image/jpeg",
+                        "data": img_str
+                    }
+                })
+            content.append({"type": "text", "text": f"Here's the content of the file {os.path.basename(file_path)}:\n\n{file_text}\n\nPlease analyze this content based on the given prompt."})
+
+    return content
 
+def process_claude(model, prompt, file_path, chat_history=None, context_files=None, on_token=None, file_text=None):
+    client = get_anthropic_client()
+    
     try:
-        response = client.messages.create(
+        content = build_claude_content(model, prompt, file_path, chat_history, context_files, file_text)
+    except Exception as e:
+        return f"Error processing file {file_path}: {str(e)}"
+
+    estimated_tokens = estimate_tokens(content)
+    try:
+        if on_token:
+            stream = call_with_rate_limit("Claude", model, lambda: client.messages.create(
+                model=model,
+                max_tokens=CLAUDE_MAX_TOKENS,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": content
+                    }
+                ],
+                stream=True
+            ), estimated_tokens)
+            parts = []
+            start_output_tokens = 0
+            for event in stream:
+                if event.type == "message_start":
+                    usage = getattr(event.message, "usage", None)
+                    record_anthropic_usage(usage)
+                    start_output_tokens = getattr(usage, "output_tokens", 0) or 0
+                elif event.type == "message_delta" and getattr(event, "usage", None):
+                    # Cumulative count, part of which message_start already reported
+                    usage_stats.record_output(max(0, (event.usage.output_tokens or 0) - start_output_tokens))
+                elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                    parts.append(event.delta.text)
+                    on_token(event.delta.text)
+            return "".join(parts)
+
+        response = call_with_rate_limit("Claude", model, lambda: client.messages.create(
             model=model,
-            max_tokens=4000,
+            max_tokens=CLAUDE_MAX_TOKENS,
             messages=[
                 {
                     "role": "user",
                     "content": content
                 }
             ]
-        )
+        ), estimated_tokens)
+        record_anthropic_usage(response.usage)
         return response.content[0].text
     
     except Exception as e:
         return f"Error processing request: {str(e)}"
 
-def process_gemini(model, prompt, file_path, chat_history=None, context_files=None):
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-    model = genai.GenerativeModel(model_name=model)
+def process_gemini(model, prompt, file_path, chat_history=None, context_files=None, on_token=None, file_text=None):
+    model_name = model
+    model = get_gemini_model(model)
     
-    generation_config = {
-        "temperature": 0.7,
-        "top_p": 0.95,
-        "top_k": 64,
-        "max_output_tokens": 8000
-    }
+    generation_config = dict(GEMINI_GENERATION_CONFIG)
     
+    try:
+        file_images = []
+        if file_text is None and file_path and not file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+            file_text, file_images = read_file(file_path, image_profile="Gemini")
+    except Exception as e:
+        return f"Error processing file {file_path}: {str(e)}"
+    plan = fit_request(model_name, generation_config["max_output_tokens"], prompt, file_path, chat_history, context_files, file_text, file_images)
+
     contents = []
-    if chat_history:
-        for item_type, item_content in chat_history:
+    if plan.chat_history:
+        for item_type, item_content in plan.chat_history:
             if item_type == "text":
                 contents.append(item_content)
             elif item_type == "image":
-                image = Image.open(BytesIO(base64.b64decode(item_content)))
-                contents.append(image)
+                image = image_from_base64(item_content)
+                if image:
+                    contents.append(image.pil())
     
-    if context_files:
+    if plan.context_entries:
         contents.append("Context Files:")
-        for context_file in context_files:
-            try:
-                if context_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                    with open(context_file, "rb") as image_file:
-                        image_bytes = image_file.read()
-                    processed_image = process_image(image_bytes)
-                    if processed_image:
-                        image = Image.open(BytesIO(base64.b64decode(processed_image)))
-                        contents.extend([
-                            f"Context image: {os.path.basename(context_file)}",
-                            image
-                        ])
-                    else:
-                        contents.append(f"[Failed to process image file: {os.path.basename(context_file)}]")
+        for entry in plan.context_entries:
+            if entry.kind == "image":
+                if entry.images:
+                    image = image_from_base64(entry.images[0], processed=True).pil()
+                    contents.extend([
+                        f"Context image: {entry.name}",
+                        image
+                    ])
                 else:
-                    file_content = read_file(context_file)
-                    contents.append(f"Content of context file {os.path.basename(context_file)}:\n\n{file_content}")
-            except Exception as e:
-                contents.append(f"Error reading context file {os.path.basename(context_file)}: {str(e)}")
+                    contents.append(f"[Failed to process image file: {entry.name}]")
+            elif entry.kind == "document":
+                contents.append(f"Content of context file {entry.name}:\n\n{entry.text}")
+                for img_str in entry.images:
+                    contents.append(image_from_base64(img_str, processed=True).pil())
+            else:
+                contents.append(f"Error reading context file {entry.name}: {entry.error}")
         contents.append("End of Context Files")
     
     contents.append(f"Prompt:\n{prompt}")
@@ -306,9 +475,9 @@ def process_gemini(model, prompt, file_path, chat_history=None, context_files=No
             if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
                 with open(file_path, "rb") as image_file:
                     image_bytes = image_file.read()
-                processed_image = process_image(image_bytes)
+                processed_image = load_image(image_bytes, profile="Gemini")
                 if processed_image:
-                    image = Image.open(BytesIO(base64.b64decode(processed_image)))
+                    image = processed_image.pil()
                     contents.extend([
                         "Please analyze this image based on the given prompt:",
                         image
@@ -316,16 +485,41 @@ def process_gemini(model, prompt, file_path, chat_history=None, context_files=No
                 else:
                     contents.append("[An image was shared but could not be processed.]")
             else:
-                file_content = read_file(file_path)
-                contents.append(f"Here's the content of the file {os.path.basename(file_path)}:\n\n{file_content}\n\nPlease analyze this content based on the given prompt.")
+                file_text, file_images = plan.file_text, plan.file_images
+                contents.append(f"Here's the content of the file {os.path.basename(file_path)}:\n\n{file_text}\n\nPlease analyze this content based on the given prompt.")
+                for img_str in file_images:
+                    contents.append(image_from_base64(img_str, processed=True).pil())
         except Exception as e:
             return f"Error processing file {file_path}: {str(e)}"
 
+    estimated_tokens = estimate_tokens(contents)
     try:
-        response = model.generate_content(
+        if on_token:
+            stream = call_with_rate_limit("Gemini", model_name, lambda: prime_stream(model.generate_content(
+                contents,
+                generation_config=generation_config,
+                stream=True
+            )), estimated_tokens)
+            parts = []
+            usage = None
+            for chunk in stream:
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue  # Chunk without text parts (e.g. only safety metadata)
+                if text:
+                    parts.append(text)
+                    on_token(text)
+            record_gemini_usage(usage)
+            text = "".join(parts).strip()
+            return text if text else "No text response generated."
+
+        response = call_with_rate_limit("Gemini", model_name, lambda: model.generate_content(
             contents,
             generation_config=generation_config
-        )
+        ), estimated_tokens)
+        record_gemini_usage(getattr(response, "usage_metadata", None))
         
         if response.text:
             return response.text.strip()
@@ -335,51 +529,67 @@ def process_gemini(model, prompt, file_path, chat_history=None, context_files=No
     except Exception as e:
         return f"Error processing request: {str(e)}"    
     
-def process_mistral(model, prompt, file_path, chat_history=None, context_files=None):
-    client = MistralClient(api_key=os.getenv("MISTRAL_API_KEY"))
+def process_mistral(model, prompt, file_path, chat_history=None, context_files=None, on_token=None, file_text=None):
+    client = get_mistral_client()
     
+    try:
+        if file_text is None and file_path and not file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+            file_text, _ = read_file(file_path, include_images=False)  # Mistral models here are text-only
+    except Exception as e:
+        return f"Error processing file {file_path}: {str(e)}"
+    plan = fit_request(model, MISTRAL_MAX_TOKENS, prompt, file_path, chat_history, context_files, file_text)
+
     messages = []
     
     # Include chat history
-    if chat_history:
-        for item_type, item_content in chat_history:
+    if plan.chat_history:
+        for item_type, item_content in plan.chat_history:
             if item_type == "text":
                 messages.append(ChatMessage(role="user", content=item_content))
     
     # Add context files
-    if context_files:
+    if plan.context_entries:
         context_message = "Context Files:\n"
-        for context_file in context_files:
-            try:
-                if not context_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                    file_content = read_file(context_file)
-                    context_message += f"Content of context file {os.path.basename(context_file)}:\n{file_content}\n\n"
-                else:
-                    context_message += f"[An image file was provided: {os.path.basename(context_file)}]\n"
-            except Exception as e:
-                context_message += f"Error reading context file {os.path.basename(context_file)}: {str(e)}\n"
+        for entry in plan.context_entries:
+            if entry.kind == "document":
+                context_message += f"Content of context file {entry.name}:\n{entry.text}\n\n"
+            elif entry.kind == "image":
+                context_message += f"[An image file was provided: {entry.name}]\n"
+            else:
+                context_message += f"Error reading context file {entry.name}: {entry.error}\n"
         context_message += "End of Context Files\n"
         messages.append(ChatMessage(role="user", content=context_message))
+
+    # The prompt goes before the file so the shared part of the conversation comes first
+    messages.append(ChatMessage(role="user", content=f"Prompt:\n{prompt}"))
     
     # Process file if provided
     if file_path:
-        try:
-            if not file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                file_content = read_file(file_path)
-                messages.append(ChatMessage(role="user", content=f"Here's the content of the file {os.path.basename(file_path)}:\n\n{file_content}\n\nPlease analyze this content based on the given prompt."))
-            else:
-                messages.append(ChatMessage(role="user", content=f"[An image file was provided: {os.path.basename(file_path)}]"))
-        except Exception as e:
-            return f"Error processing file {file_path}: {str(e)}"
-    
-    # Add the user's prompt
-    messages.append(ChatMessage(role="user", content=f"Prompt:\n{prompt}"))
+        if not file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+            messages.append(ChatMessage(role="user", content=f"Here's the content of the file {os.path.basename(file_path)}:\n\n{plan.file_text}\n\nPlease analyze this content based on the given prompt."))
+        else:
+            messages.append(ChatMessage(role="user", content=f"[An image file was provided: {os.path.basename(file_path)}]"))
     
+    estimated_tokens = estimate_tokens(messages)
     try:
-        response = client.chat(
+        if on_token:
+            parts = []
+            stream = call_with_rate_limit("Mistral", model, lambda: prime_stream(client.chat_stream(model=model, messages=messages, max_tokens=MISTRAL_MAX_TOKENS)), estimated_tokens)
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    record_mistral_usage(chunk.usage)  # Only on the final chunk
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    on_token(delta)
+            return "".join(parts).strip()
+
+        response = call_with_rate_limit("Mistral", model, lambda: client.chat(
             model=model,
-            messages=messages
-        )
+            messages=messages,
+            max_tokens=MISTRAL_MAX_TOKENS
+        ), estimated_tokens)
+        record_mistral_usage(getattr(response, "usage", None))
         return response.choices[0].message.content.strip()
     except Exception as e:
         return f"Error processing request: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,241 @@
+import re
+import sys
+import json
+import itertools
+import time
+import random
+import threading
+from datetime import datetime, timezone
+
+# Requests and tokens per minute allowed for each developer (per model), can be adjusted to your account's quota.
+# When a provider reports its real limits in response headers, those take over.
+RATE_LIMITS = {
+    "ChatGPT": {"rpm": 500, "tpm": 200000},
+    "Claude": {"rpm": 50, "tpm": 40000},
+    "Gemini": {"rpm": 360, "tpm": 1000000},
+    "Mistral": {"rpm": 300, "tpm": 500000},
+}
+
+# Retries for rate limits (429), overload (529) and server errors (5xx)
+MAX_RETRIES = 6
+BASE_BACKOFF = 1.0  # Seconds, doubled on every attempt
+MAX_BACKOFF = 60.0
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+RATE_LIMIT_HEADERS = {
+    "limit_requests": ("x-ratelimit-limit-requests", "anthropic-ratelimit-requests-limit"),
+    "remaining_requests": ("x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"),
+    "reset_requests": ("x-ratelimit-reset-requests", "anthropic-ratelimit-requests-reset"),
+    "limit_tokens": ("x-ratelimit-limit-tokens", "anthropic-ratelimit-tokens-limit"),
+    "remaining_tokens": ("x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining"),
+    "reset_tokens": ("x-ratelimit-reset-tokens", "anthropic-ratelimit-tokens-reset"),
+}
+
+# Rough token cost of one image, used when estimating request size
+IMAGE_TOKEN_ESTIMATE = 1000
+
+class TokenBucket:
+    # Refills continuously at rate_per_minute up to one minute's worth. take() reserves capacity right away
+    # (the bucket may go negative) and returns how long the caller must sleep before using it.
+    def __init__(self, rate_per_minute):
+        self.rate_per_minute = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.rate_per_minute, self.tokens + (now - self.updated) * self.rate_per_minute / 60.0)
+        self.updated = now
+
+    def take(self, amount, now):
+        self._refill(now)
+        # A request larger than the whole bucket would never fit, it only has to wait for a full bucket
+        amount = min(amount, self.rate_per_minute)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens * 60.0 / self.rate_per_minute
+
+    def set_rate(self, rate_per_minute):
+        self.rate_per_minute = max(1.0, rate_per_minute)
+        self.tokens = min(self.tokens, self.rate_per_minute)
+
+class RateLimiter:
+    # Request and token buckets for one developer/model. The sending rate is adjusted as responses come in:
+    # cut back sharply on a 429 and crept back up on success (AIMD), so a batch runs just under the quota.
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm  # Configured (or header-reported) ceilings
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        with self._lock:
+            now = time.monotonic()
+            delay = max(self.requests.take(1, now), self.tokens.take(tokens, now), self.blocked_until - now)
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.requests.set_rate(min(self.rpm, self.requests.rate_per_minute + self.rpm * 0.05))
+            self.tokens.set_rate(min(self.tpm, self.tokens.rate_per_minute + self.tpm * 0.05))
+
+    def on_rate_limited(self, retry_after=None):
+        with self._lock:
+            self.requests.set_rate(max(self.rpm * 0.1, self.requests.rate_per_minute * 0.7))
+            self.tokens.set_rate(max(self.tpm * 0.1, self.tokens.rate_per_minute * 0.7))
+            if retry_after:
+                # Every thread holds off, not just the one that was told to
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def update_from_headers(self, headers):
+        limits = parse_rate_limit_headers(headers)
+        if not limits:
+            return
+        with self._lock:
+            if limits.get("limit_requests"):
+                self.rpm = limits["limit_requests"]
+                self.requests.set_rate(min(self.requests.rate_per_minute, self.rpm))
+            if limits.get("limit_tokens"):
+                self.tpm = limits["limit_tokens"]
+                self.tokens.set_rate(min(self.tokens.rate_per_minute, self.tpm))
+            # Quota used up (possibly by another process on the same key): wait for the window to reset
+            for kind in ("requests", "tokens"):
+                if limits.get(f"remaining_{kind}") == 0 and limits.get(f"reset_{kind}"):
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + limits[f"reset_{kind}"])
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(developer, model):
+    with _limiters_lock:
+        key = (developer, model)
+        if key not in _limiters:
+            limits = RATE_LIMITS.get(developer, {"rpm": 60, "tpm": 100000})
+            _limiters[key] = RateLimiter(limits["rpm"], limits["tpm"])
+        return _limiters[key]
+
+def _parse_duration(value):
+    # "1s", "6m0s", "20ms", "0.5" (seconds) or an RFC 3339 timestamp; returns seconds from now
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * scale[u] for n, u in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+    except ValueError:
+        return None
+
+def parse_rate_limit_headers(headers):
+    # Understands OpenAI (x-ratelimit-*) and Anthropic (anthropic-ratelimit-*) headers
+    if not headers:
+        return {}
+    limits = {}
+    for key, names in RATE_LIMIT_HEADERS.items():
+        for name in names:
+            value = headers.get(name)
+            if value is None:
+                continue
+            if key.startswith("reset_"):
+                limits[key] = _parse_duration(value)
+            else:
+                try:
+                    limits[key] = int(value)
+                except ValueError:
+                    pass
+    return limits
+
+def status_code_of(error):
+    # OpenAI/Anthropic use status_code, Mistral http_status, google.api_core an int code
+    for attr in ("status_code", "http_status", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+def headers_of(error):
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    return headers
+
+def _is_transient(error):
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRY_STATUS_CODES
+    # Dropped connections and timeouts from any of the SDKs
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(
+        word in type(error).__name__ for word in ("Connection", "Timeout"))
+
+def call_with_rate_limit(developer, model, request, estimated_tokens=0):
+    # Waits for room in the developer/model quota, runs request() and retries transient failures with
+    # jittered exponential backoff (honouring retry-after). Anything else, or the last failure, is raised.
+    limiter = get_limiter(developer, model)
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(estimated_tokens)
+        try:
+            result = request()
+        except Exception as e:
+            if attempt == MAX_RETRIES or not _is_transient(e):
+                raise
+            headers = headers_of(e)
+            retry_after = _parse_duration(headers.get("retry-after")) if headers else None
+            if status_code_of(e) == 429:
+                limiter.on_rate_limited(retry_after)
+                if headers:
+                    limiter.update_from_headers(headers)
+            delay = retry_after or min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"{developer} request failed ({status_code_of(e) or type(e).__name__}), retrying in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+            continue
+        limiter.on_success()
+        return result
+
+def prime_stream(stream):
+    # Lazy streaming iterators (Mistral, Gemini) only send the request when first read; reading the first
+    # chunk inside call_with_rate_limit lets their rate-limit errors be retried like any other request
+    iterator = iter(stream)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return iter(())
+    return itertools.chain([first], iterator)
+
+def observe_response(developer, response):
+    # httpx response hook: lets every successful response tune the limiter from its rate-limit headers
+    if not parse_rate_limit_headers(response.headers):
+        return
+    try:
+        model = json.loads(response.request.content).get("model")
+    except Exception:
+        return
+    if model:
+        get_limiter(developer, model).update_from_headers(response.headers)
+
+def estimate_tokens(payload):
+    # Fast upper-bound guess for rate limiting: ~4 characters per token, a flat cost per image
+    if isinstance(payload, str):
+        if payload.startswith("data:image/"):
+            return IMAGE_TOKEN_ESTIMATE
+        return len(payload) // 4 + 1
+    if isinstance(payload, dict):
+        if payload.get("type") in ("image", "image_url"):
+            return IMAGE_TOKEN_ESTIMATE
+        return sum(estimate_tokens(value) for value in payload.values())
+    if isinstance(payload, (list, tuple)):
+        return sum(estimate_tokens(item) for item in payload)
+    if hasattr(payload, "content"):  # Mistral ChatMessage
+        return estimate_tokens(payload.content)
+    if hasattr(payload, "size"):  # PIL image
+        return IMAGE_TOKEN_ESTIMATE
+    return 0
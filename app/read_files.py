@@ -1,27 +1,58 @@
 import os
-import base64
-import io
+import sys
 from io import BytesIO
 from docx import Document
 from pptx import Presentation
 import fitz  # PyMuPDF
-import csv
-import openpyxl
 from bs4 import BeautifulSoup
 import markdown2
-from PIL import Image
+from app.spreadsheets import read_table
+from app.images import load_image, load_images, image_from_base64, get_process_pool, TRANSCODE_WORKERS
 
-def read_document(file_path):
+# Part of the extraction cache key, bump whenever a change here alters what the readers return
+EXTRACTOR_VERSION = "7"
+
+# PDFs with at least this many pages (in the requested range) are split across the process pool, can be adjusted
+PDF_PARALLEL_MIN_PAGES = 16
+
+# Defaults for every PDF read, set from the CLI/environment with set_pdf_options:
+# PDF_PAGES limits extraction to a page range such as "1-10,15" (1-based, inclusive), None for all pages.
+# PDF_RENDER_DPI renders each page to an image at that resolution instead of extracting its embedded images,
+# which is faster and smaller for scanned PDFs (one full-page scan per page); None keeps embedded images.
+PDF_PAGES = os.getenv("BATCH_PROCESSOR_PDF_PAGES") or None
+PDF_RENDER_DPI = int(os.getenv("BATCH_PROCESSOR_PDF_RENDER_DPI", "0")) or None
+
+# Documents often repeat the same logo, header or background on every page. Extracted images are deduplicated:
+# exact copies by content, near-copies when their perceptual hashes differ in at most NEAR_DUPLICATE_DISTANCE of 64 bits.
+# MAX_IMAGES_PER_DOCUMENT keeps only the largest images of a document (earlier ones win ties), None for no cap.
+NEAR_DUPLICATE_DISTANCE = 4
+MAX_IMAGES_PER_DOCUMENT = int(os.getenv("BATCH_PROCESSOR_MAX_IMAGES", "0")) or None
+
+def set_pdf_options(pages=None, render_dpi=None):
+    global PDF_PAGES, PDF_RENDER_DPI
+    PDF_PAGES = pages or None
+    PDF_RENDER_DPI = render_dpi or None
+
+def pdf_options():
+    # The settings in effect, part of the extraction cache key
+    return {"pages": PDF_PAGES, "render_dpi": PDF_RENDER_DPI}
+
+def image_options():
+    return {"near_duplicate_distance": NEAR_DUPLICATE_DISTANCE, "max_images": MAX_IMAGES_PER_DOCUMENT}
+
+def read_document(file_path, include_images=True, image_profile=None):
+    # include_images=False is the text-only mode for models that can't take images: no image is decoded at all.
+    # image_profile names the IMAGE_PROFILES entry (a developer) whose size/quality the images are transcoded to.
     _, ext = os.path.splitext(file_path)
     ext = ext.lower()
 
     try:
         if ext in ['.docx', '.doc']:
-            return read_word_document(file_path)
+            return read_word_document(file_path, include_images, image_profile)
         elif ext == '.pdf':
-            return read_pdf_document(file_path)
+            return read_pdf_document(file_path, PDF_PAGES, include_images, PDF_RENDER_DPI, image_profile)
         elif ext in ['.pptx', '.ppt']:
-            return read_powerpoint_document(file_path)
+            return read_powerpoint_document(file_path, include_images, image_profile)
         elif ext == '.rtf':
             return read_rtf_document(file_path)
         elif ext == '.odt':
@@ -33,92 +64,135 @@ def read_document(file_path):
     except Exception as e:
         raise IOError(f"Error reading document {file_path}: {str(e)}")
 
-def process_image(image_path_or_bytes, preserve_original=False):
-    try:
-        # Open the image from file path or bytes
-        if isinstance(image_path_or_bytes, str):
-            image = Image.open(image_path_or_bytes)
+def process_image(image_path_or_bytes, preserve_original=False, profile=None):
+    # Base64 JPEG of the processed image (see app/images.py), or None if it can't be decoded
+    image = load_image(image_path_or_bytes, preserve_original, profile)
+    return image.base64 if image else None
+
+def process_images(images_bytes, profile=None):
+    # Base64 JPEGs of the images that could be decoded, in order; large ones are transcoded in parallel
+    return [image.base64 for image in load_images(images_bytes, profile=profile) if image]
+
+def select_images(images, max_images=None):
+    # images: base64 strings from process_image in document order. Drops exact and near duplicates (the first
+    # occurrence stays), then applies the per-document cap, ranking by pixel area and position.
+    max_images = max_images or MAX_IMAGES_PER_DOCUMENT
+    selected = []
+    seen_digests = set()
+    hashes = []
+    for position, img_str in enumerate(images):
+        image = image_from_base64(img_str, processed=True)
+        if image.digest in seen_digests:
+            continue
+        seen_digests.add(image.digest)
+        try:
+            dhash = image.dhash()
+            if any(bin(dhash ^ other).count("1") <= NEAR_DUPLICATE_DISTANCE for other in hashes):
+                continue
+            hashes.append(dhash)
+        except Exception as e:
+            print(f"Error hashing image: {str(e)}", file=sys.stderr)
+        selected.append((position, image, img_str))
+
+    if max_images and len(selected) > max_images:
+        ranked = sorted(selected, key=lambda item: (-item[1].size[0] * item[1].size[1], item[0]))[:max_images]
+        selected = sorted(ranked, key=lambda item: item[0])
+    return [img_str for _, _, img_str in selected]
+
+def parse_page_range(pages, page_count):
+    # "1-10,15,20-" -> sorted 0-based page numbers within the document
+    if not pages:
+        return list(range(page_count))
+    selected = set()
+    for part in str(pages).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            start = int(start) if start.strip() else 1
+            end = int(end) if end.strip() else page_count
         else:
-            image = Image.open(io.BytesIO(image_path_or_bytes))
-        
-        if not preserve_original:
-            # Convert image based on its mode
-            if image.mode in ['RGBA', 'LA']:
-                # Images with alpha channel
-                background = Image.new('RGBA', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[3])  # 3 is the alpha channel
-                image = background.convert('RGB')
-            elif image.mode == 'P':
-                # Palette images
-                image = image.convert('RGBA')
-                background = Image.new('RGBA', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[3])
-                image = background.convert('RGB')
-            elif image.mode != 'RGB':
-                # All other modes (grayscale, CMYK, YCbCr, etc.)
-                image = image.convert('RGB')
-
-            # Resize the image if it's too large
-            max_size = (1280, 720)  # 720p
-            image.thumbnail(max_size, Image.LANCZOS)
-
-        # Save the image to a byte stream
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG", quality=85)
-        
-        # Encode the image to base64
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        
-        return img_str
-    except Exception as e:
-        print(f"Error processing image: {str(e)}")
-        return None
+            start = end = int(part)
+        selected.update(range(max(start, 1) - 1, min(end, page_count)))
+    return sorted(selected)
 
-def read_pdf_document(file_path):
+def _read_pdf_pages(file_path, page_numbers, include_images, render_dpi, image_profile=None):
+    # Text blocks and images of some pages of a PDF; runs in a worker process for large documents
     doc = fitz.open(file_path)
     content = []
-    images = []
+    images_bytes = []
+    seen_xrefs = set()
 
-    for page in doc:
+    for page_number in page_numbers:
+        page = doc[page_number]
         text = page.get_text("blocks")
         for block in text:
             if block[6] == 0:  # If it's a text block
                 content.append(block[4].strip())
-        
+
+        if not include_images:
+            continue
+        if render_dpi:
+            pixmap = page.get_pixmap(dpi=render_dpi)
+            images_bytes.append(pixmap.tobytes("png"))
+            continue
         for img in page.get_images(full=True):
             xref = img[0]
+            if xref in seen_xrefs:
+                continue  # The same embedded image object placed again (logos, backgrounds)
+            seen_xrefs.add(xref)
             base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            img_str = process_image(image_bytes)
-            if img_str:
-                images.append(img_str)
+            images_bytes.append(base_image["image"])
 
-    return "\n\n".join(content), images
+    doc.close()
+    return content, process_images(images_bytes, image_profile)
 
-def read_word_document(file_path):
-    doc = Document(file_path)
+def read_pdf_document(file_path, pages=None, include_images=True, render_dpi=None, image_profile=None):
+    # Page renders are all kept: similar-looking pages (plain text, forms) would otherwise pass for near duplicates
+    # and be dropped, so only embedded images go through select_images
+    with fitz.open(file_path) as doc:
+        page_numbers = parse_page_range(pages, doc.page_count)
+    keep = (lambda images: images) if render_dpi else select_images
+
+    if len(page_numbers) < PDF_PARALLEL_MIN_PAGES or TRANSCODE_WORKERS < 2:
+        content, images = _read_pdf_pages(file_path, page_numbers, include_images, render_dpi, image_profile)
+        return "\n\n".join(content), keep(images)
+
+    # Contiguous runs of pages per task (a few per worker to even out slow pages), results kept in page order
+    chunk_size = max(1, -(-len(page_numbers) // (TRANSCODE_WORKERS * 4)))
+    chunks = [page_numbers[i:i + chunk_size] for i in range(0, len(page_numbers), chunk_size)]
+    futures = [get_process_pool().submit(_read_pdf_pages, file_path, chunk, include_images, render_dpi, image_profile) for chunk in chunks]
     content = []
     images = []
+    for future in futures:
+        chunk_content, chunk_images = future.result()
+        content.extend(chunk_content)
+        images.extend(chunk_images)
+    return "\n\n".join(content), keep(images)
+
+def read_word_document(file_path, include_images=True, image_profile=None):
+    doc = Document(file_path)
+    content = []
+    images_bytes = []
 
     for para in doc.paragraphs:
         if para.text.strip():
             content.append(para.text.strip())
 
     for rel in doc.part.rels.values():
-        if "image" in rel.target_ref:
+        if include_images and "image" in rel.target_ref:
             image_part = rel.target_part
-            image_bytes = image_part.blob
-            img_str = process_image(image_bytes)
-            if img_str:
-                images.append(img_str)
+            images_bytes.append(image_part.blob)
 
-    return "\n\n".join(content), images
+    return "\n\n".join(content), select_images(process_images(images_bytes, image_profile))
 
-def read_powerpoint_document(file_path):
+def read_powerpoint_document(file_path, include_images=True, image_profile=None):
     prs = Presentation(file_path)
     content = []
-    images = []
+    images_bytes = []
     slide_count = len(prs.slides)
+    seen_images = set()
 
     content.append(f"PowerPoint presentation with {slide_count} slides.")
 
@@ -126,35 +200,34 @@ def read_powerpoint_document(file_path):
         slide_content = []
         for shape in slide.shapes:
             if hasattr(shape, 'text') and shape.text.strip():
-                # Limit text to first 100 characters per shape
-                slide_content.append(shape.text.strip()[:100])
-            if shape.shape_type == 13:  # Picture
-                image_bytes = shape.image.blob
+                slide_content.append(shape.text.strip())
+            if shape.shape_type == 13 and not include_images:
+                slide_content.append("[Image]")
+            elif shape.shape_type == 13 and shape.image.sha1 in seen_images:
+                slide_content.append("[Image]")  # Repeated on an earlier slide, sent once
+            elif shape.shape_type == 13:  # Picture
+                # Collected here and transcoded together (in parallel) once every slide has been read
                 try:
-                    # Use process_image function
-                    processed_image = process_image(image_bytes)
-                    if processed_image:
-                        images.append(processed_image)
-                        slide_content.append("[Image]")
+                    images_bytes.append(shape.image.blob)
+                    seen_images.add(shape.image.sha1)
+                    slide_content.append("[Image]")
                 except Exception as e:
-                    print(f"Error processing image in slide {i}: {str(e)}")
+                    print(f"Error processing image in slide {i}: {str(e)}", file=sys.stderr)
 
         # Summarize slide content
         if slide_content:
             summary = f"Slide {i}: " + " | ".join(slide_content)
-            content.append(summary[:200])  # Limit each slide summary to 200 characters
+            content.append(summary)
 
         # Only process notes if they exist and are non-empty
         if slide.has_notes_slide and slide.notes_slide.notes_text_frame.text.strip():
             notes = slide.notes_slide.notes_text_frame.text.strip()
-            content.append(f"Notes for Slide {i}: {notes[:100]}")  # Limit notes to 100 characters
+            content.append(f"Notes for Slide {i}: {notes}")
 
-    # Limit total content to 2000 characters
+    # Kept whole; the request budget planner (app/budget.py) trims it only if it doesn't fit the model
     full_content = "\n".join(content)
-    if len(full_content) > 2000:
-        full_content = full_content[:1997] + "..."
 
-    return full_content, images
+    return full_content, select_images(process_images(images_bytes, image_profile))
 
 def read_rtf_document(file_path):
     # RTF reading is complex and requires a dedicated library
@@ -184,25 +257,8 @@ def read_text_document(file_path):
     return content, []
 
 def read_spreadsheet(file_path):
-    _, ext = os.path.splitext(file_path)
-    ext = ext.lower()
-
+    # Streamed in row blocks; large sheets are summarized and sampled (see app/spreadsheets.py)
     try:
-        if ext == '.csv':
-            with open(file_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
-                reader = csv.reader(csvfile)
-                content = '\n'.join([', '.join(row) for row in reader])
-        elif ext in ['.xlsx', '.xls']:
-            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-            sheets_data = []
-            for sheet in wb.worksheets:
-                sheet_data = f"Sheet: {sheet.title}\n"
-                sheet_data += '\n'.join([', '.join(str(cell.value) if cell.value is not None else '' for cell in row) for row in sheet.iter_rows()])
-                sheets_data.append(sheet_data)
-            content = '\n\n'.join(sheets_data)
-        else:
-            raise ValueError(f"Unsupported spreadsheet format: {ext}")
-
-        return content, []
+        return read_table(file_path), []
     except Exception as e:
         raise IOError(f"Error reading spreadsheet {file_path}: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,47 @@
+import time
+import base64
+from io import BytesIO
+from PIL import Image
+from app.processor import is_error_result
+
+# JSON-friendly form of a process_request result, shared by the CLI output and job checkpoints
+
+def image_to_base64(image):
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+def result_to_record(index, file_path, developer, model, result):
+    record = {
+        "index": index,
+        "file": file_path,
+        "developer": developer,
+        "model": model,
+        "status": "error" if is_error_result(result) else "ok",
+        "text": None,
+        "images": [],
+        "completed_at": time.time(),
+    }
+    if isinstance(result, tuple):
+        text, image = result
+        record["text"] = text
+        if isinstance(image, Image.Image):
+            record["images"].append(image_to_base64(image))
+    elif isinstance(result, str):
+        record["text"] = result
+    elif isinstance(result, Image.Image):  # DALL-E
+        record["images"].append(image_to_base64(result))
+    else:
+        record["status"] = "error"
+        record["text"] = f"Unsupported output format: {type(result)}"
+    return record
+
+def record_to_result(record):
+    # Inverse of result_to_record, in the shapes ChatbotUI.handle_result accepts
+    images = [Image.open(BytesIO(base64.b64decode(img_str))) for img_str in record.get("images", [])]
+    text = record.get("text")
+    if images and text:
+        return text, images[0]
+    if images:
+        return images[0]
+    return text or ""
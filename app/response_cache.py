@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+import threading
+from app.cache import DiskCache, CACHE_DIR
+from app.utils import extraction_cache_key
+
+# Opt-in cache of model responses, so re-running the same prompt over the same files (after a crash, a mistake or
+# one added file) returns the earlier answers instead of paying for them again. A response is reused only for the
+# same developer, model, generation settings, prompt, file content, context files and chat history.
+# Only complete text responses are cached, never errors or generated images.
+# Turn on with BATCH_PROCESSOR_RESPONSE_CACHE=1 (or --response-cache in cli.py); defaults, can be adjusted:
+RESPONSE_CACHE_ENABLED = os.getenv("BATCH_PROCESSOR_RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_TTL = int(os.getenv("BATCH_PROCESSOR_RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds
+RESPONSE_CACHE_SIZE = 1024 * 1024 * 1024  # 1 GB, least recently used responses are evicted first
+RESPONSE_CACHE_VERSION = 1  # Bump when the request layout changes, so old responses aren't served for new requests
+
+response_cache = DiskCache(os.path.join(CACHE_DIR, "responses"), RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+_stats_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+def set_response_cache(enabled, ttl=None):
+    global RESPONSE_CACHE_ENABLED
+    RESPONSE_CACHE_ENABLED = enabled
+    if ttl is not None:
+        response_cache.ttl = ttl
+
+def response_cache_key(developer, model, params, prompt, file_path=None, chat_history=None, context_files=None, file_text=None):
+    # None if the request can't be keyed (e.g. the file can't be read); such requests are simply not cached.
+    # context_files is the prepared ContextBundle.
+    try:
+        if file_text is not None:
+            file_key = "text:" + hashlib.sha256(file_text.encode()).hexdigest()  # One chunk of a long document
+        elif file_path:
+            # The content hash plus the reader options (PDF pages, spreadsheet rows, ...) that shape the extracted text
+            file_key = "file:" + extraction_cache_key(file_path, image_profile=developer)
+        else:
+            file_key = None
+        context_key = context_files.digest() if context_files else None
+    except OSError:
+        return None
+    key = json.dumps({
+        "version": RESPONSE_CACHE_VERSION,
+        "developer": developer,
+        "model": model,
+        "params": params,
+        "prompt": prompt,
+        "file": file_key,
+        "context": context_key,
+        "history": hashlib.sha256(json.dumps(chat_history or []).encode()).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def cached_response(key):
+    global _hits, _misses
+    value = response_cache.get(key)
+    with _stats_lock:
+        if value is None:
+            _misses += 1
+        else:
+            _hits += 1
+    return value
+
+def cache_response(key, result):
+    if isinstance(result, str) and result:
+        response_cache.set(key, result)
+
+def reset_response_cache_stats():
+    global _hits, _misses
+    with _stats_lock:
+        _hits = _misses = 0
+
+def response_cache_summary():
+    with _stats_lock:
+        if not _hits and not _misses:
+            return None
+        return f"Response cache: {_hits} of {_hits + _misses} requests answered from the cache"
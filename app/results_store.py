@@ -0,0 +1,187 @@
+import os
+import io
+import time
+import hashlib
+import sqlite3
+import threading
+from PIL import Image
+from app.processor import is_error_result
+from app.images import ProcessedImage, image_from_pil
+
+# Every batch result is written to an SQLite database as it arrives, so nothing is lost on a crash and the
+# output pane, search and Save Output read results back from disk instead of keeping them all in memory.
+# Can be moved with BATCH_PROCESSOR_RESULTS_DB; set BATCH_PROCESSOR_RESULTS_STORE=0 to keep results in memory only.
+RESULTS_DB = os.getenv("BATCH_PROCESSOR_RESULTS_DB", os.path.join(os.path.expanduser("~"), ".batch-processor", "results.sqlite3"))
+RESULTS_STORE = os.getenv("BATCH_PROCESSOR_RESULTS_STORE", "1") != "0"
+RESULTS_KEEP_DAYS = 30  # Sessions older than this are deleted when the store is opened, can be adjusted
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prompts (
+    hash TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL,
+    file_path TEXT,
+    developer TEXT,
+    model TEXT,
+    prompt_hash TEXT,
+    status TEXT NOT NULL,
+    text TEXT,
+    latency REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_session ON results (session_id, id);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    result_id INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    jpeg BLOB NOT NULL  -- The encoded image: JPEG, or PNG for generated images
+);
+CREATE INDEX IF NOT EXISTS images_result ON images (result_id, id);
+"""
+
+def prompt_hash(prompt):
+    return hashlib.sha256((prompt or "").encode()).hexdigest()
+
+class ResultsStore:
+    # One connection shared by the GUI and batch threads, serialized by a lock; every write is committed at once
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+            self._db.commit()
+
+    def new_session(self):
+        with self._lock:
+            cursor = self._db.execute("INSERT INTO sessions (started_at) VALUES (?)", (time.time(),))
+            self._db.commit()
+            return cursor.lastrowid
+
+    def add_result(self, session_id, file_path, developer, model, prompt, result, stats=None):
+        # Stores a process_request result with its images (as the processed image bytes) and returns its id.
+        # stats: the scheduler's {"latency", "input_tokens", "output_tokens"} for the request, if known.
+        stats = stats or {}
+        text, images = None, []
+        if isinstance(result, tuple):
+            text, image = result
+            images = [image]
+        elif isinstance(result, str):
+            text = result
+        elif result is not None:
+            images = [result]
+        processed = [image if isinstance(image, ProcessedImage) else image_from_pil(image) for image in images if image is not None]
+        digest = prompt_hash(prompt)
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO prompts (hash, text) VALUES (?, ?)", (digest, prompt or ""))
+            cursor = self._db.execute(
+                "INSERT INTO results (session_id, file_path, developer, model, prompt_hash, status, text, latency, input_tokens, output_tokens, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, file_path, developer, model, digest, "error" if is_error_result(result) else "ok", text,
+                 stats.get("latency"), stats.get("input_tokens"), stats.get("output_tokens"), time.time()))
+            result_id = cursor.lastrowid
+            for image in processed:
+                if image is None:
+                    continue
+                width, height = Image.open(io.BytesIO(image.data)).size  # Header only
+                self._db.execute("INSERT INTO images (result_id, digest, width, height, jpeg) VALUES (?, ?, ?, ?, ?)",
+                                 (result_id, image.digest, width, height, image.data))
+            self._db.commit()
+        return result_id
+
+    def text(self, result_id):
+        with self._lock:
+            row = self._db.execute("SELECT text FROM results WHERE id = ?", (result_id,)).fetchone()
+        return row[0] if row else None
+
+    def result_images(self, result_id):
+        # [(image id, digest, width, height)], without the image data
+        with self._lock:
+            return self._db.execute("SELECT id, digest, width, height FROM images WHERE result_id = ? ORDER BY id", (result_id,)).fetchall()
+
+    def image(self, image_id):
+        with self._lock:
+            row = self._db.execute("SELECT jpeg FROM images WHERE id = ?", (image_id,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def result(self, result_id):
+        # The full record as a dict, prompt text included
+        with self._lock:
+            self._db.row_factory = sqlite3.Row
+            try:
+                row = self._db.execute(
+                    "SELECT results.*, prompts.text AS prompt FROM results LEFT JOIN prompts ON prompts.hash = results.prompt_hash "
+                    "WHERE results.id = ?", (result_id,)).fetchone()
+            finally:
+                self._db.row_factory = None
+        return dict(row) if row else None
+
+    def search(self, query, session_id=None, limit=None):
+        # Ids of results whose text or file path contains query (case-insensitive for ASCII), oldest first
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        sql = "SELECT id FROM results WHERE (text LIKE ? ESCAPE '\\' OR file_path LIKE ? ESCAPE '\\')"
+        params = [pattern, pattern]
+        if session_id is not None:
+            sql += " AND session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._db.execute(sql, params).fetchall()]
+
+    def prune(self, keep_days=RESULTS_KEEP_DAYS):
+        cutoff = time.time() - keep_days * 86400
+        with self._lock:
+            old = "SELECT id FROM sessions WHERE started_at < ?"
+            self._db.execute(f"DELETE FROM images WHERE result_id IN (SELECT id FROM results WHERE session_id IN ({old}))", (cutoff,))
+            self._db.execute(f"DELETE FROM results WHERE session_id IN ({old})", (cutoff,))
+            self._db.execute("DELETE FROM sessions WHERE started_at < ?", (cutoff,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def save_result(store, session_id, file_path, developer, model, prompt, result, stats=None):
+    # add_result that never raises: a result that can't be stored is still shown from memory (returns None)
+    if store is None:
+        return None
+    try:
+        return store.add_result(session_id, file_path, developer, model, prompt, result, stats)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Failed to store the result for {file_path}: {str(e)}")
+        return None
+
+_store = None
+_store_failed = False
+_store_lock = threading.Lock()
+
+def get_results_store():
+    # The process-wide store, opened on first use; None if disabled or the database can't be opened
+    global _store, _store_failed
+    with _store_lock:
+        if _store is None and RESULTS_STORE and not _store_failed:
+            try:
+                _store = ResultsStore()
+                _store.prune()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Results store unavailable, keeping results in memory: {str(e)}")
+                _store = None
+                _store_failed = True
+        return _store
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+from fnmatch import fnmatch
+
+# Batch and context directories are listed with os.scandir, so the file type comes with each directory entry
+# instead of one stat call per file (sizes are only read when a size filter or watch mode needs them).
+# Defaults, can be adjusted here or with BATCH_PROCESSOR_SCAN_*:
+SCAN_RECURSIVE = os.getenv("BATCH_PROCESSOR_SCAN_RECURSIVE", "0") == "1"  # Include subdirectories (hidden ones such as .git are skipped)
+SCAN_INCLUDE = [p.strip() for p in os.getenv("BATCH_PROCESSOR_SCAN_INCLUDE", "").split(",") if p.strip()]  # e.g. "reports/*,*.pdf"
+SCAN_EXCLUDE = [p.strip() for p in os.getenv("BATCH_PROCESSOR_SCAN_EXCLUDE", "").split(",") if p.strip()]  # e.g. "drafts/*,*_old.*"
+SCAN_MIN_SIZE = int(os.getenv("BATCH_PROCESSOR_SCAN_MIN_SIZE", "0"))  # Bytes
+SCAN_MAX_SIZE = int(os.getenv("BATCH_PROCESSOR_SCAN_MAX_SIZE", "0"))  # Bytes, 0 for no limit
+
+WATCH_INTERVAL = 5  # Seconds between scans of a watched directory, can be adjusted
+WATCH_SETTLE_SECONDS = 2  # A file must be unmodified this long before it is picked up, so half-copied files wait for the next scan
+
+def matches(rel_path, patterns):
+    # Glob patterns are matched against the path relative to the scanned directory (with / separators) and the file name,
+    # so "*.pdf" matches at any depth and "reports/*" only under reports/
+    rel_path = rel_path.replace(os.sep, "/")
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch(rel_path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+def iter_files(directory, extensions=None, recursive=SCAN_RECURSIVE, include=None, exclude=None, min_size=SCAN_MIN_SIZE, max_size=SCAN_MAX_SIZE):
+    # Yields (path relative to directory, os.DirEntry) for the matching files, in no particular order.
+    # Temporary Office files ('~$...') are always left out; include/exclude default to SCAN_INCLUDE/SCAN_EXCLUDE.
+    include = SCAN_INCLUDE if include is None else include
+    exclude = SCAN_EXCLUDE if exclude is None else exclude
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        try:
+            entries = os.scandir(os.path.join(directory, rel_dir) if rel_dir else directory)
+        except OSError as e:
+            if not rel_dir:
+                raise
+            print(f"Skipping {os.path.join(directory, rel_dir)}: {str(e)}", file=sys.stderr)
+            continue
+        with entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        # Symlinked directories are not followed, so a link back up the tree can't loop
+                        if recursive and not entry.name.startswith(".") and not matches(rel_path, exclude):
+                            pending.append(rel_path)
+                        continue
+                    if not entry.is_file() or entry.name.startswith("~$"):
+                        continue
+                    if extensions and not entry.name.lower().endswith(tuple(extensions)):
+                        continue
+                    if (include and not matches(rel_path, include)) or matches(rel_path, exclude):
+                        continue
+                    if min_size or max_size:
+                        size = entry.stat().st_size
+                        if size < min_size or (max_size and size > max_size):
+                            continue
+                except OSError:
+                    continue  # Removed while the directory was being listed
+                yield rel_path, entry
+
+def scan_files(directory, extensions=None, **options):
+    # Sorted relative paths of the matching files, see iter_files for the options
+    return sorted(rel_path for rel_path, _ in iter_files(directory, extensions, **options))
+
+class DirectoryWatcher:
+    # Scans a directory on each poll() and returns the files that are new or changed (mtime or size) since the
+    # previous poll, once they have settled. The first poll returns every file; across runs the job manifest
+    # decides which of them still need a request.
+    def __init__(self, directory, extensions=None, settle_seconds=WATCH_SETTLE_SECONDS, **options):
+        self.directory = directory
+        self.extensions = extensions
+        self.settle_seconds = settle_seconds
+        self.options = options
+        self._seen = {}  # relative path -> (mtime_ns, size) when it was last returned
+
+    def poll(self):
+        now = time.time()
+        current = {}
+        changed = []
+        for rel_path, entry in iter_files(self.directory, self.extensions, **self.options):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            current[rel_path] = signature
+            if self._seen.get(rel_path) != signature and now - stat.st_mtime >= self.settle_seconds:
+                changed.append(rel_path)
+        # Files that went away are forgotten, so one that comes back is picked up again
+        self._seen = {rel_path: signature for rel_path, signature in self._seen.items() if rel_path in current}
+        for rel_path in changed:
+            self._seen[rel_path] = current[rel_path]
+        return sorted(changed)
@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from app.processor import process_request
+from app.chunking import process_map_reduce
+from app.context import prepare_context
+from app.clients import set_pool_size
+from app.usage import track_request_usage
+
+# Number of requests kept in flight during a batch, can be adjusted
+MAX_CONCURRENT_REQUESTS = 8
+
+# Ceiling on in-flight requests per developer, shared by every batch in the process
+DEVELOPER_CONCURRENCY = {
+    "ChatGPT": 8,
+    "Claude": 4,
+    "Gemini": 8,
+    "Mistral": 4,
+}
+
+# With context files, the first request of a batch is sent on its own so it can write the provider's prompt cache
+# before the others read it (otherwise the first few requests in flight all pay for a cache miss)
+WARM_PROMPT_CACHE = True
+PROMPT_CACHE_DEVELOPERS = ("ChatGPT", "Claude")
+
+_developer_slots = {}
+_developer_slots_lock = threading.Lock()
+
+def developer_slots(developer):
+    # One semaphore per developer, created on first use from DEVELOPER_CONCURRENCY
+    with _developer_slots_lock:
+        if developer not in _developer_slots:
+            limit = DEVELOPER_CONCURRENCY.get(developer, MAX_CONCURRENT_REQUESTS)
+            _developer_slots[developer] = threading.BoundedSemaphore(limit)
+        return _developer_slots[developer]
+
+def _file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except (OSError, TypeError):
+        return 0
+
+class BatchScheduler:
+    # Runs process_request over many files with several requests in flight at once.
+    # Work can be started largest-file-first so a slow file doesn't end up alone at the tail of the run,
+    # but results are always handed back in input order.
+    # pause/resume/cancel are safe to call from another thread (e.g. the GUI) while run() is being consumed.
+    # map_reduce processes documents too long for the model in parts (see app/chunking.py).
+    def __init__(self, max_workers=MAX_CONCURRENT_REQUESTS, order_by_size=False, map_reduce=False):
+        self.max_workers = max(1, max_workers)
+        self.order_by_size = order_by_size
+        self.map_reduce = map_reduce
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._cancelled = threading.Event()
+        self.request_stats = {}  # index -> {"latency", "input_tokens", "output_tokens"} of each finished request
+
+    def pause(self):
+        # Requests already sent are allowed to finish, nothing new is started until resume()
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._resumed.set()
+
+    @property
+    def paused(self):
+        return not self._resumed.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def run(self, developer, model, prompt, file_paths, chat_history=None, context_files=None, on_token=None):
+        # Generator yielding (index, file_path, result) in input order as soon as each result (and every one before it) is ready.
+        # on_token(index, text), if given, streams partial text for every in-flight request as it arrives.
+        order = list(range(len(file_paths)))
+        if self.order_by_size:
+            order.sort(key=lambda i: _file_size(file_paths[i]), reverse=True)
+
+        # Parse the context directory once for the whole batch rather than once per file
+        context_files = prepare_context(context_files)
+
+        workers = min(self.max_workers, DEVELOPER_CONCURRENCY.get(developer, self.max_workers), max(1, len(file_paths)))
+        set_pool_size(workers)
+        warm_cache = WARM_PROMPT_CACHE and context_files and developer in PROMPT_CACHE_DEVELOPERS and len(file_paths) > 1
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+        try:
+            futures = {}
+            for n, i in enumerate(order):
+                futures[i] = executor.submit(self._run_one, i, developer, model, prompt, file_paths[i], chat_history, context_files, on_token)
+                if n == 0 and warm_cache:
+                    while not futures[i].done() and not self.cancelled:
+                        wait([futures[i]], timeout=0.2)
+            for i, file_path in enumerate(file_paths):
+                # Poll so a cancel doesn't have to wait for an in-flight request to come back
+                while not futures[i].done() and not self.cancelled:
+                    wait([futures[i]], timeout=0.2)
+                if self.cancelled:
+                    break
+                yield i, file_path, futures[i].result()
+        finally:
+            # Drops queued work if the batch is cancelled or the caller stops consuming results early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_one(self, index, developer, model, prompt, file_path, chat_history, context_files, on_token):
+        self._resumed.wait()
+        if self.cancelled:
+            return None
+        token_callback = (lambda text: on_token(index, text)) if on_token else None
+        # Latency (from when the request could start) and token usage per file.
+        # Map-reduce chunk requests run on threads of their own, so their tokens aren't counted.
+        with track_request_usage() as usage:
+            if self.map_reduce:
+                # The developer slot is taken per request by the chunks themselves; holding one here for the whole
+                # file could leave every slot held by a file waiting on its own chunks
+                start = time.perf_counter()
+                try:
+                    result = process_map_reduce(developer, model, prompt, file_path, chat_history, context_files, token_callback,
+                                                slot=developer_slots(developer))
+                except Exception as e:
+                    result = f"Error processing file {file_path}: {str(e)}"
+            else:
+                with developer_slots(developer):
+                    start = time.perf_counter()
+                    try:
+                        result = process_request(developer, model, prompt, file_path, chat_history, context_files, token_callback)
+                    except Exception as e:
+                        result = f"Error processing file {file_path}: {str(e)}"
+        self.request_stats[index] = {"latency": time.perf_counter() - start, **usage}
+        return result
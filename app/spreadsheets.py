@@ -0,0 +1,181 @@
+import os
+import csv
+import random
+from collections import deque
+import openpyxl
+
+# Spreadsheets are streamed in row blocks rather than loaded whole, and sent as a compact table:
+# per-column summary stats over every row, plus a sample of the rows themselves.
+# Defaults, can be adjusted here or with BATCH_PROCESSOR_SHEET_* (see set_spreadsheet_options):
+SHEET_MAX_ROWS = int(os.getenv("BATCH_PROCESSOR_SHEET_ROWS", "200"))  # Rows shown per sheet; smaller sheets are shown whole
+SHEET_SAMPLE = os.getenv("BATCH_PROCESSOR_SHEET_SAMPLE", "head")  # Which rows: "head", "tail" or "random"
+SHEET_COLUMNS = os.getenv("BATCH_PROCESSOR_SHEET_COLUMNS") or None  # e.g. "date,amount" or "1,3"; None for all
+ROW_BLOCK_SIZE = 1000
+DISTINCT_LIMIT = 1000  # Distinct values tracked per column before reporting "over 1000"
+RANDOM_SEED = 0  # Fixed, so the same file always gives the same sample (and extraction cache entry)
+
+def set_spreadsheet_options(max_rows=None, sample=None, columns=None):
+    global SHEET_MAX_ROWS, SHEET_SAMPLE, SHEET_COLUMNS
+    if max_rows is not None:
+        SHEET_MAX_ROWS = max_rows
+    if sample:
+        SHEET_SAMPLE = sample
+    SHEET_COLUMNS = columns or SHEET_COLUMNS
+
+def spreadsheet_options():
+    # The settings in effect, part of the extraction cache key
+    return {"max_rows": SHEET_MAX_ROWS, "sample": SHEET_SAMPLE, "columns": SHEET_COLUMNS}
+
+def iter_row_blocks(file_path, block_size=ROW_BLOCK_SIZE):
+    # Yields (sheet name, header, rows) with up to block_size rows at a time; the header is the sheet's first row
+    _, ext = os.path.splitext(file_path)
+    ext = ext.lower()
+    if ext == '.csv':
+        with open(file_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
+            yield from _blocks(os.path.basename(file_path), csv.reader(csvfile), block_size)
+    elif ext in ['.xlsx', '.xls']:
+        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in wb.worksheets:
+                yield from _blocks(sheet.title, sheet.iter_rows(values_only=True), block_size)
+        finally:
+            wb.close()
+    else:
+        raise ValueError(f"Unsupported spreadsheet format: {ext}")
+
+def _blocks(name, rows, block_size):
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    header = [_cell(value) for value in header]
+    block = []
+    for row in rows:
+        block.append([_cell(value) for value in row])
+        if len(block) >= block_size:
+            yield name, header, block
+            block = []
+    yield name, header, block
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _select_columns(header, columns):
+    # Indexes of the requested columns, by name (case-insensitive) or 1-based number
+    if not columns:
+        return list(range(len(header)))
+    lookup = {name.lower(): i for i, name in enumerate(header)}
+    selected = []
+    for column in str(columns).split(","):
+        column = column.strip()
+        if column.isdigit() and 0 < int(column) <= len(header):
+            selected.append(int(column) - 1)
+        elif column.lower() in lookup:
+            selected.append(lookup[column.lower()])
+    return selected or list(range(len(header)))
+
+class ColumnStats:
+    # Running summary of one column
+    def __init__(self, name):
+        self.name = name
+        self.filled = 0
+        self.numeric = 0
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.distinct = set()
+        self.overflow = False
+
+    def add(self, value):
+        if value == "":
+            return
+        self.filled += 1
+        if not self.overflow:
+            self.distinct.add(value)
+            if len(self.distinct) > DISTINCT_LIMIT:
+                self.overflow = True
+                self.distinct = set()
+        try:
+            number = float(value.replace(",", ""))
+        except ValueError:
+            return
+        self.numeric += 1
+        self.total += number
+        self.minimum = number if self.minimum is None else min(self.minimum, number)
+        self.maximum = number if self.maximum is None else max(self.maximum, number)
+
+    def describe(self, rows):
+        parts = [f"{self.filled}/{rows} filled"]
+        parts.append(f"over {DISTINCT_LIMIT} distinct" if self.overflow else f"{len(self.distinct)} distinct")
+        if self.numeric and self.numeric >= self.filled * 0.9:
+            parts.append(f"numeric, min {self.minimum:g}, max {self.maximum:g}, mean {self.total / self.numeric:g}")
+        return f"- {self.name}: " + ", ".join(parts)
+
+class RowSampler:
+    # Keeps max_rows rows from a stream of unknown length: the first, the last, or a uniform random sample
+    def __init__(self, max_rows, mode="head"):
+        self.max_rows = max_rows
+        self.mode = mode
+        self.seen = 0
+        self.rows = deque(maxlen=max_rows) if mode == "tail" else []
+        self._random = random.Random(RANDOM_SEED)
+
+    def add(self, row):
+        self.seen += 1
+        if self.mode == "tail":
+            self.rows.append((self.seen, row))
+        elif len(self.rows) < self.max_rows:
+            self.rows.append((self.seen, row))
+        elif self.mode == "random":
+            # Reservoir sampling: every row ends up in the sample with the same probability
+            slot = self._random.randrange(self.seen)
+            if slot < self.max_rows:
+                self.rows[slot] = (self.seen, row)
+
+    def sample(self):
+        return [row for _, row in sorted(self.rows, key=lambda item: item[0])]
+
+def _escape(value):
+    return value.replace("\n", " ").replace("|", "\\|")
+
+def format_sheet(name, header, stats, sampler, mode):
+    rows = sampler.seen
+    shown = len(sampler.rows)
+    description = "showing all rows" if shown == rows else f"showing {shown} rows ({mode} sample)"
+    lines = [f"Sheet: {name} ({rows} rows x {len(header)} columns, {description})", "Columns:"]
+    lines.extend(column.describe(rows) for column in stats)
+    lines.append("Rows:")
+    lines.append("|".join(_escape(column) for column in header))
+    lines.extend("|".join(_escape(value) for value in row) for row in sampler.sample())
+    return "\n".join(lines)
+
+def read_table(file_path, max_rows=None, sample=None, columns=None):
+    # Every sheet of a CSV/XLSX file as compact text: stats over all rows and up to max_rows sample rows
+    max_rows = SHEET_MAX_ROWS if max_rows is None else max_rows
+    sample = sample or SHEET_SAMPLE
+    columns = columns or SHEET_COLUMNS
+    sheets = []
+    current = None
+    for name, header, block in iter_row_blocks(file_path):
+        if current is None or current[0] != name:
+            if current:
+                sheets.append(format_sheet(*current, sample))
+            selected = _select_columns(header, columns)
+            current = (name, [header[i] or f"column {i + 1}" for i in selected],
+                       [ColumnStats(header[i] or f"column {i + 1}") for i in selected], RowSampler(max_rows, sample))
+            current_columns = selected
+        _, _, stats, sampler = current
+        for row in block:
+            values = [row[i] if i < len(row) else "" for i in current_columns]
+            if not any(values):
+                continue  # Trailing empty rows are common in exported sheets
+            for column, value in zip(stats, values):
+                column.add(value)
+            sampler.add(values)
+    if current:
+        sheets.append(format_sheet(*current, sample))
+    return "\n\n".join(sheets)
@@ -1,14 +1,24 @@
 from PyQt6.QtWidgets import (QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, 
                              QPushButton, QComboBox, QTextEdit, QFileDialog, 
-                             QLabel, QScrollArea, QMessageBox,QProgressBar)
+                             QLabel, QMessageBox,QProgressBar, QLineEdit)
 from PyQt6.QtWidgets import QCheckBox
-from PyQt6.QtGui import QPixmap, QImage
-from PyQt6.QtCore import Qt, QByteArray, QBuffer
+from PyQt6.QtCore import Qt, QByteArray, QThread
 from io import BytesIO
 from html import escape
 import base64
 from PIL import Image
-from app.processor import process_request
+from app.scheduler import BatchScheduler
+from app.worker import BatchWorker, ExportWorker
+from app.utils import get_filtered_files
+from app.scanner import SCAN_RECURSIVE
+from app.manifest import JobManifest
+from app.records import record_to_result
+from app.usage import usage_stats
+from app.response_cache import response_cache_summary, reset_response_cache_stats
+from app.images import ProcessedImage, image_from_pil
+from app.history import HistoryManager, make_summarizer, SUMMARIZE_HISTORY
+from app.output_view import OutputModel, OutputView
+from app.results_store import get_results_store, save_result
 import os 
 
 class ChatbotUI(QMainWindow):
@@ -19,7 +29,7 @@ class ChatbotUI(QMainWindow):
 
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
-        self.chat_history = []
+        self.history = HistoryManager()  # Prompt/response turns only, for Include Chat History
 
         layout = QVBoxLayout()
 
@@ -53,6 +63,15 @@ class ChatbotUI(QMainWindow):
         self.include_history_checkbox = QCheckBox("Include Chat History?")
         layout.addWidget(self.include_history_checkbox)
 
+        # Show responses as they are generated
+        self.stream_checkbox = QCheckBox("Stream Responses")
+        self.stream_checkbox.setChecked(True)
+        layout.addWidget(self.stream_checkbox)
+
+        # Documents longer than the model's context window are processed in parts, then combined
+        self.map_reduce_checkbox = QCheckBox("Split Long Documents")
+        layout.addWidget(self.map_reduce_checkbox)
+
         # Add context directory
         context_layout = QHBoxLayout()
         self.add_context_checkbox = QCheckBox("Add Context")
@@ -72,6 +91,10 @@ class ChatbotUI(QMainWindow):
         dir_layout.addWidget(self.dir_button)
         self.dir_label = QLabel("No Directory Selected")
         dir_layout.addWidget(self.dir_label)
+        self.recursive_checkbox = QCheckBox("Include Subfolders")
+        self.recursive_checkbox.setChecked(SCAN_RECURSIVE)
+        self.recursive_checkbox.stateChanged.connect(self.rescan_directories)
+        dir_layout.addWidget(self.recursive_checkbox)
         layout.addLayout(dir_layout)
 
         # Process button
@@ -79,6 +102,18 @@ class ChatbotUI(QMainWindow):
         self.process_button.clicked.connect(self.process_request)
         layout.addWidget(self.process_button)
 
+        # Pause/cancel controls, only shown while a batch is running
+        control_layout = QHBoxLayout()
+        self.pause_button = QPushButton("Pause")
+        self.pause_button.clicked.connect(self.toggle_pause)
+        self.pause_button.setVisible(False)
+        control_layout.addWidget(self.pause_button)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_processing)
+        self.cancel_button.setVisible(False)
+        control_layout.addWidget(self.cancel_button)
+        layout.addLayout(control_layout)
+
         # Processing label
         self.processing_label = QLabel("Processing...")
         self.processing_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -92,15 +127,20 @@ class ChatbotUI(QMainWindow):
         self.progress_bar.setVisible(False)
         layout.addWidget(self.progress_bar)
 
-        # Output display
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setObjectName("output_area") 
-        self.output_widget = QWidget()
-        self.output_layout = QVBoxLayout()
-        self.output_widget.setLayout(self.output_layout)
-        self.scroll_area.setWidget(self.output_widget)
-        layout.addWidget(self.scroll_area)
+        # Search the output (results are searched in the results store)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search output (Enter for the next match)")
+        self.search_input.returnPressed.connect(self.search_output)
+        layout.addWidget(self.search_input)
+
+        # Output display: everything shown here is also what Save Output writes.
+        # Results are written to the results store as they arrive and the pane reads them back from it.
+        self.results_store = get_results_store()
+        self.session_id = self.results_store.new_session() if self.results_store else None
+        self.output_model = OutputModel(self.results_store)
+        self.output_view = OutputView(self.output_model)
+        self.output_view.setObjectName("output_area")
+        layout.addWidget(self.output_view)
 
         # Save button
         self.save_button = QPushButton("Save Output")
@@ -119,6 +159,15 @@ class ChatbotUI(QMainWindow):
         self.current_file_index = 0
         self.context_files = []
         self.context_directory = None
+        self.worker = None
+        self.worker_thread = None
+        self.stream_buffers = {}
+        self.stream_row = None
+        self.next_result_index = 0
+        self.batch_offset = 0
+        self.current_prompt = None
+        self.export_worker = None
+        self.export_thread = None
 
     def toggle_context_button(self, state):
         self.context_button.setVisible(state == Qt.CheckState.Checked.value)
@@ -137,7 +186,7 @@ class ChatbotUI(QMainWindow):
 
     def get_filtered_files(self, directory):
         # Takes a directory path as input and returns a list of files in that directory that are not temporary files (do not start with '~$') and have specific extensions.
-        filtered_files =  [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f)) and not f.startswith('~$') and f.lower().endswith(('.txt', '.pdf', '.html', '.doc', '.docx','.ppt','.pptx', '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.mp3', '.wav', '.ogg', '.m4a'))]
+        filtered_files = get_filtered_files(directory, recursive=self.recursive_checkbox.isChecked())
         print(f"Filtered files: {filtered_files}")  # Debug statement
         return filtered_files
 
@@ -155,6 +204,16 @@ class ChatbotUI(QMainWindow):
             self.current_file_index = 0
             self.dir_label.setText("No Directory Selected")
 
+    def rescan_directories(self):
+        # Lists the selected directories again when "Include Subfolders" is toggled
+        if self.selected_directory:
+            self.directory_files = self.get_filtered_files(self.selected_directory)
+            self.current_file_index = 0
+            self.dir_label.setText(f"Directory Selected: {len(self.directory_files)} files")
+        if self.context_directory:
+            self.context_files = self.get_filtered_files(self.context_directory)
+            self.context_button.setText(f"Context Directory: {len(self.context_files)} files")
+
     def select_context_directory(self):
         # Similar to 'select_directory', this also opens a dialog for the user to select a context directory. If a directory is selected, files are filtered using 'get_filtered_files'.
         # The 'context_files' and 'context_directory' attributes are updated. Unlike the 'select_directory' method, all files in the context directory are processed simultaneously.
@@ -169,7 +228,10 @@ class ChatbotUI(QMainWindow):
             self.context_button.setText("Select Context Directory")
 
     def process_request(self):
-        # Takes a request object, processes it, and sends the request to the API.
+        # Takes a request object, processes it, and sends the request to the API on a background thread.
+        if self.worker_thread is not None:
+            return  # A batch is already running
+
         self.processing_multiple_files = bool(self.selected_directory and self.directory_files) # Flag html output generator
 
         developer = self.developer_combo.currentText()
@@ -180,39 +242,198 @@ class ChatbotUI(QMainWindow):
             self.append_to_output("Please provide a prompt")
             return
     
-        self.processing_label.show() # Show the label
-        chat_history = self.chat_history if self.include_history_checkbox.isChecked() else None
+        # Requests run concurrently, so every file sees the history as it was when the batch started
+        chat_history = self.history.items() if self.include_history_checkbox.isChecked() else None
+        self.history.summarizer = make_summarizer(developer, model) if SUMMARIZE_HISTORY else None
+        self.current_prompt = prompt
         
         context_files = None
         if self.add_context_checkbox.isChecked() and self.context_directory and self.context_files:
             context_files = [os.path.join(self.context_directory, f) for f in self.context_files]      
  
-        if self.selected_directory and self.directory_files:
-            self.progress_bar.setVisible(True)
+        manifest = None
+        self.batch_offset = 0
+        if self.processing_multiple_files:
+            file_paths = [os.path.join(self.selected_directory, f) for f in self.directory_files]
+            manifest = JobManifest.open_job(self.selected_directory, developer, model, prompt, file_paths, context_files)
+            file_paths = self.resume_job(manifest, file_paths)
+            if file_paths is None:
+                manifest.close()
+                return
+            self.batch_offset = len(self.directory_files) - len(file_paths)
             self.progress_bar.setMaximum(len(self.directory_files))
-            
-            while self.current_file_index < len(self.directory_files):
-                current_file = os.path.join(self.selected_directory, self.directory_files[self.current_file_index])
-                self.progress_bar.setValue(self.current_file_index + 1)
-                
-                result = process_request(developer, model, prompt, current_file, chat_history, context_files)
-                self.handle_result(result)
-                
-                self.append_to_output(f"Processed file {self.current_file_index + 1} of {len(self.directory_files)}: {self.directory_files[self.current_file_index]}")
-                self.current_file_index += 1
-                
-            self.append_to_output("All files in the directory have been processed.")
-            self.progress_bar.setVisible(False)
-            self.current_file_index = 0  # Reset for next use
+            self.progress_bar.setValue(self.batch_offset)
+            self.progress_bar.setVisible(True)
         else:
-            result = process_request(developer, model, prompt, None, chat_history, context_files)
-            self.handle_result(result)
-    
+            file_paths = [None]
+
+        usage_stats.reset()
+        reset_response_cache_stats()
+        self.worker_thread = QThread()
+        self.worker = BatchWorker(developer, model, prompt, file_paths, chat_history, context_files,
+                                  scheduler=BatchScheduler(order_by_size=True, map_reduce=self.map_reduce_checkbox.isChecked()), stream=self.stream_checkbox.isChecked(),
+                                  manifest=manifest, store=self.results_store, session_id=self.session_id)
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.run)
+        self.worker.result_ready.connect(self.on_batch_result)
+        self.worker.token_received.connect(self.on_token_received)
+        self.worker.finished.connect(self.on_batch_finished)
+        self.worker.finished.connect(self.worker_thread.quit)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.worker_thread.finished.connect(self.worker_thread.deleteLater)
+        self.worker_thread.finished.connect(self.on_worker_thread_finished)
+
+        # Partial text per request; only the next result due (in input order) is shown live
+        self.stream_buffers = {}
+        self.stream_row = None
+        self.next_result_index = 0
+
+        self.processing_label.setText("Processing...")
+        self.processing_label.show() # Show the label
+        self.process_button.setEnabled(False)
+        self.pause_button.setText("Pause")
+        self.pause_button.setVisible(self.processing_multiple_files)
+        self.cancel_button.setVisible(True)
+        self.worker_thread.start()
+
+    def resume_job(self, manifest, file_paths):
+        # Offers to skip files completed by an earlier run of the same job (same directory, prompt, model and context).
+        # Returns the files still to process, or None if the user backs out.
+        completed = manifest.completed_files(file_paths)
+        if not completed:
+            return file_paths
+        reply = QMessageBox.question(self, "Resume Batch",
+                                     f"{len(completed)} of {len(file_paths)} files were already processed by an earlier run of this job.\n\n"
+                                     "Yes: resume and only process the remaining files\nNo: process every file again",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No | QMessageBox.StandardButton.Cancel)
+        if reply == QMessageBox.StandardButton.Cancel:
+            return None
+        if reply == QMessageBox.StandardButton.No:
+            manifest.reset()
+            manifest.add_files(file_paths)
+            return file_paths
+
+        # Bring the earlier results back into the output so the saved conversation stays complete
+        for file_path in completed:
+            record = manifest.load_output(file_path)
+            if record is not None:
+                result = record_to_result(record)
+                self.history.add_result(manifest.info.get("prompt"), result, file_path)
+                result_id = save_result(self.results_store, self.session_id, file_path, manifest.info.get("developer"),
+                                        manifest.info.get("model"), manifest.info.get("prompt"), result)
+                self.handle_result(result, result_id)
+                self.append_to_output(f"Loaded result from an earlier run: {os.path.basename(file_path)}")
+        completed = set(completed)
+        return [f for f in file_paths if f not in completed]
+
+    def on_token_received(self, index, text):
+        self.stream_buffers[index] = self.stream_buffers.get(index, "") + text
+        if index == self.next_result_index:
+            self.show_stream_buffer(index)
+
+    def show_stream_buffer(self, index):
+        if self.stream_row is None:
+            self.stream_row = self.output_model.append_text(self.stream_buffers[index])
+        else:
+            self.output_model.set_text(self.stream_row, self.stream_buffers[index])
+
+    def on_batch_result(self, index, file_path, result, result_id=None):
+        # Runs on the GUI thread for each result, in input order
+        self.stream_buffers.pop(index, None)
+        self.history.add_result(self.current_prompt, result, file_path)
+        if self.stream_row is not None:
+            if isinstance(result, str):
+                # The streamed row becomes the final output item
+                if result_id is not None:
+                    self.output_model.set_result(self.stream_row, result_id)
+                else:
+                    self.append_to_output(result, row=self.stream_row)
+                result = None
+            else:
+                self.output_model.remove_row(self.stream_row)
+            self.stream_row = None
+        if result is not None:
+            self.handle_result(result, result_id)
+        if file_path is not None:
+            self.current_file_index = self.batch_offset + index
+            self.progress_bar.setValue(self.current_file_index + 1)
+            self.append_to_output(f"Processed file {self.current_file_index + 1} of {len(self.directory_files)}: {os.path.basename(file_path)}")
+
+        # The next file may already have streamed some text while waiting for its turn
+        self.next_result_index = index + 1
+        if self.next_result_index in self.stream_buffers:
+            self.show_stream_buffer(self.next_result_index)
+
+    def on_batch_finished(self, cancelled):
+        if self.processing_multiple_files:
+            if cancelled:
+                self.append_to_output(f"Batch cancelled after {self.progress_bar.value()} of {self.progress_bar.maximum()} files. Process the same directory again to resume.")
+            else:
+                self.append_to_output("All files in the directory have been processed.")
+            if self.worker.manifest:
+                failed = self.worker.manifest.counts()["failed"]
+                if failed:
+                    self.append_to_output(f"{failed} files failed. Process the same directory again to retry them.")
+                self.worker.manifest.close()
+            if usage_stats.summary():
+                print(usage_stats.summary())
+            if response_cache_summary():
+                print(response_cache_summary())
+        elif cancelled:
+            self.append_to_output("Request cancelled.")
+        self.current_file_index = 0  # Reset for next use
+        if self.stream_row is not None:
+            self.output_model.remove_row(self.stream_row)  # Partial output of a cancelled request
+            self.stream_row = None
+        self.stream_buffers = {}
+
         self.processing_label.hide() # Hide the label
         self.progress_bar.setVisible(False)
+        self.pause_button.setVisible(False)
+        self.cancel_button.setVisible(False)
+        self.process_button.setEnabled(True)
+
+    def on_worker_thread_finished(self):
+        # References are kept until the thread has stopped, dropping a running QThread aborts
+        self.worker = None
+        self.worker_thread = None
 
-    def handle_result(self, result):
-        if isinstance(result, tuple):
+    def toggle_pause(self):
+        if self.worker is None:
+            return
+        if self.worker.scheduler.paused:
+            self.worker.resume()
+            self.pause_button.setText("Pause")
+            self.processing_label.setText("Processing...")
+        else:
+            self.worker.pause()
+            self.pause_button.setText("Resume")
+            self.processing_label.setText("Paused (requests already sent will still complete)")
+
+    def cancel_processing(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.processing_label.setText("Cancelling...")
+
+    def closeEvent(self, event):
+        # Don't leave a batch thread running behind a closed window
+        if self.worker_thread is not None:
+            self.worker.cancel()
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+        if self.export_thread is not None:
+            self.export_thread.quit()
+            self.export_thread.wait()  # Finish writing the report
+        super().closeEvent(event)
+
+    def handle_result(self, result, result_id=None):
+        if result_id is not None and isinstance(result, (str, tuple, Image.Image)):
+            # Shown from the results store rather than kept in memory
+            if self.results_store.text(result_id):
+                self.output_model.append_result(result_id)
+            for image_id, digest, width, height in self.results_store.result_images(result_id):
+                self.output_model.append_stored_image(image_id, digest, width, height)
+        elif isinstance(result, tuple):
             text, image = result
             if text:
                 self.append_to_output(text)
@@ -225,75 +446,40 @@ class ChatbotUI(QMainWindow):
         else:
             self.append_to_output(f"Unsupported output format: {type(result)}")
 
-    def get_history_prompt(self):
-        history_parts = []
-        for item_type, content, _ in self.chat_history:
-            if item_type == "text":
-                history_parts.append(content)
-            elif item_type == "image":
-                history_parts.append(f"[An image was shared in the conversation. Base64: {content[:20]}...]")
-        return "\n".join(history_parts)
-
-    def append_to_output(self, text):
-        label = QLabel(text)
-        label.setWordWrap(True)
-        label.setTextFormat(Qt.TextFormat.PlainText)
-        label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
-        self.output_layout.addWidget(label)
-        self.output_layout.addWidget(QLabel("---"))
-        
-        # Store the text content with formatting information
-        formatted_text = text.replace('\n', '<br>')  # Preserve line breaks
-        self.chat_history.append(("text", formatted_text))
+    def append_to_output(self, text, row=None):
+        # row: an existing output row (e.g. one that was streaming) to finalize instead of adding a new one.
+        # Status lines are shown and saved too; they never reach the chat history.
+        if row is None:
+            self.output_model.append_text(text)
+        else:
+            self.output_model.set_text(row, text)
 
     def append_image_to_output(self, image):
-        q_image = self.pil_to_qimage(image)
-        pixmap = QPixmap.fromImage(q_image)
-        scaled_pixmap = pixmap.scaled(400, 300, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-        
-        label = QLabel()
-        label.setPixmap(scaled_pixmap)
-        self.output_layout.addWidget(label)
-        self.output_layout.addWidget(QLabel("---"))
-        
-        # Store the image as base64
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        self.chat_history.append(("image", img_str))
+        # Processed once: the pane keeps its encoded bytes and draws a cached thumbnail
+        processed = image if isinstance(image, ProcessedImage) else image_from_pil(image)
+        if processed is None:
+            self.append_to_output("[An image was returned but could not be displayed.]")
+            return
+        self.output_model.append_image(processed)  # Shown as a cached thumbnail
 
     def pil_to_qimage(self, pil_image):
-        buffer = BytesIO()
-        pil_image.save(buffer, format="PNG")
-        q_image = QImage()
-        q_image.loadFromData(buffer.getvalue())
-        return q_image
-
-    def update_output_display(self):
-        output = ""
-        for item_type, item_content in self.chat_history:
-            if item_type == "text":
-                output += f"{item_content}\n\n---\n\n"
-            elif item_type == "image":
-                # Convert PIL Image to QPixmap
-                buffer = BytesIO()
-                item_content.save(buffer, format="PNG")
-                q_image = QImage()
-                q_image.loadFromData(buffer.getvalue())
-                pixmap = QPixmap.fromImage(q_image)
-                
-                # Scale the image
-                scaled_pixmap = pixmap.scaled(400, 300, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                
-                # Save the scaled image and add it to the output
-                buffer = QBuffer()
-                buffer.open(QBuffer.OpenModeFlag.ReadWrite)
-                scaled_pixmap.save(buffer, "PNG")
-                image_data = buffer.data().toBase64()
-                output += f'<img src="data:image/png;base64,{image_data.data().decode()}" />\n\n---\n\n'
+        return image_from_pil(pil_image).qimage()
+
+    def search_output(self):
+        query = self.search_input.text().strip()
+        if not query:
+            return
+        current = self.output_view.currentIndex()
+        row = self.output_model.find(query, current.row() + 1 if current.isValid() else 0, self.session_id)
+        if row is None:
+            QMessageBox.information(self, "Search", f"Nothing in the output contains \"{query}\".")
+            return
+        index = self.output_model.index(row)
+        self.output_view.setCurrentIndex(index)
+        self.output_view.scrollTo(index, OutputView.ScrollHint.PositionAtTop)
 
     def save_output(self):
-        if self.output_layout.count() == 0:
+        if self.output_model.rowCount() == 0:
             QMessageBox.warning(self, "No Content", "There's no content to save.")
             return
     
@@ -302,70 +488,34 @@ class ChatbotUI(QMainWindow):
         if not file_path:
             return  # User cancelled the save dialog
         
-        html_content = self.get_html_output()
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            QMessageBox.information(self, "Save Successful", f"Output saved to {file_path}")
-        except Exception as e:
-            QMessageBox.critical(self, "Save Failed", f"Failed to save output: {str(e)}")
-
-    def get_html_output(self):
-        css = """
-        <style>
-            body {
-                font-family: 'Segoe UI', Arial, sans-serif;
-                line-height: 1.6;
-                color: #333;
-                max-width: 800px;
-                margin: 0 auto;
-                padding: 20px;
-                background-color: #f0f0f0;
-            }
-            .chat-item {
-                margin-bottom: 20px;
-                padding: 10px;
-                border-radius: 5px;
-                background-color: #fff;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.12), 0 1px 2px rgba(0,0,0,0.24);
-            }
-            .chat-item img {
-                max-width: 100%;
-                height: auto;
-                margin-top: 10px;
-            }
-            .separator {
-                border: none;
-                border-top: 1px solid #ddd;
-                margin: 20px 0;
-            }
-        </style>
-        """
-        
-        html_parts = [
-            '<!DOCTYPE html>',
-            '<html lang="en">',
-            '<head>',
-            '<meta charset="UTF-8">',
-            '<meta name="viewport" content="width=device-width, initial-scale=1.0">',
-            '<title>Conversation History</title>',
-            css,
-            '</head>',
-            '<body>',
-            '<h1>Conversation History</h1>'
-        ]
-        
-        for item_type, content in self.chat_history:
-            html_parts.append('<div class="chat-item">')
-            if item_type == "text":
-                # Use the stored formatted text directly
-                html_parts.append(f'<p>{content}</p>')
-            elif item_type == "image":
-                html_parts.append(f'<img src="data:image/png;base64,{content}" alt="Conversation Image">')
-            html_parts.append('</div>')
-        
-        html_parts.append('</body></html>')
-        return '\n'.join(html_parts)
+        # Written on a background thread, item by item, so a large output doesn't freeze the window
+        self.export_thread = QThread()
+        self.export_worker = ExportWorker(file_path, self.output_model.items())
+        self.export_worker.moveToThread(self.export_thread)
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.finished.connect(self.on_export_finished)
+        self.export_worker.finished.connect(self.export_thread.quit)
+        self.export_worker.finished.connect(self.export_worker.deleteLater)
+        self.export_thread.finished.connect(self.export_thread.deleteLater)
+        self.export_thread.finished.connect(self.on_export_thread_finished)
+        self.save_button.setEnabled(False)
+        self.save_button.setText("Saving...")
+        self.export_thread.start()
+
+    def on_export_finished(self, files, error):
+        self.save_button.setEnabled(True)
+        self.save_button.setText("Save Output")
+        if error:
+            QMessageBox.critical(self, "Save Failed", f"Failed to save output: {error}")
+        elif len(files) > 1:
+            QMessageBox.information(self, "Save Successful", f"Output saved to {files[0]} and {len(files) - 1} pages next to it")
+        else:
+            QMessageBox.information(self, "Save Successful", f"Output saved to {files[0]}")
+
+    def on_export_thread_finished(self):
+        # References are kept until the thread has stopped, dropping a running QThread aborts
+        self.export_worker = None
+        self.export_thread = None
 
     def format_file_content(self, file_header, content):
         html = [f'<div class="file-section"><h2>{escape(file_header)}</h2>']
@@ -386,6 +536,8 @@ class ChatbotUI(QMainWindow):
         return '\n'.join(html)
    
     def clear_output(self):
-            for i in reversed(range(self.output_layout.count())): 
-                self.output_layout.itemAt(i).widget().setParent(None)
-            self.chat_history.clear()  # Clear the chat history when clearing the output
\ No newline at end of file
+            self.output_model.clear()
+            self.history.clear()  # Clear the chat history when clearing the output
+            if self.results_store:
+                self.session_id = self.results_store.new_session()  # Cleared results stay in the store, but out of search
+            self.stream_row = None  # Removed above, a new one is created if a request is still streaming
\ No newline at end of file
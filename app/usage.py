@@ -0,0 +1,106 @@
+import threading
+from contextlib import contextmanager
+
+# Prompt cache accounting. Every request of a batch shares the same prefix (history, context files, prompt),
+# which OpenAI and Anthropic can serve from their prompt cache; this tallies how much of the input actually was.
+# Gemini and Mistral usage is counted too, so every request's token counts reach the results store.
+
+def _field(usage, name):
+    # Usage arrives as an SDK object or, from bulk results, as a plain dict
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage.get(name)
+    return getattr(usage, name, None)
+
+class UsageStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.cache_hits = 0
+            self.input_tokens = 0
+            self.cached_tokens = 0
+            self.cache_write_tokens = 0
+            self.output_tokens = 0
+
+    def record(self, input_tokens, cached_tokens=0, cache_write_tokens=0, output_tokens=0):
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.cache_write_tokens += cache_write_tokens
+            self.output_tokens += output_tokens
+            if cached_tokens:
+                self.cache_hits += 1
+        _track(input_tokens, output_tokens)
+
+    def record_output(self, output_tokens):
+        # Streamed Claude responses report their output tokens in a separate, final event
+        with self._lock:
+            self.output_tokens += output_tokens
+        _track(0, output_tokens)
+
+    def hit_rate(self):
+        # Share of all input tokens that were read from the cache
+        with self._lock:
+            return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+    def summary(self):
+        if not self.requests:
+            return None
+        return (f"Prompt cache: {self.cache_hits} of {self.requests} requests hit, "
+                f"{self.hit_rate():.0%} of {self.input_tokens} input tokens read from cache")
+
+usage_stats = UsageStats()
+
+_tracked = threading.local()
+
+@contextmanager
+def track_request_usage():
+    # Tokens recorded on this thread while the block runs, i.e. by one request. The counts stay None
+    # if the response carried no usage (e.g. a stream cut short, or a response served from the response cache).
+    totals = {"input_tokens": None, "output_tokens": None}
+    previous = getattr(_tracked, "totals", None)
+    _tracked.totals = totals
+    try:
+        yield totals
+    finally:
+        _tracked.totals = previous
+
+def _track(input_tokens, output_tokens):
+    totals = getattr(_tracked, "totals", None)
+    if totals is not None:
+        totals["input_tokens"] = (totals["input_tokens"] or 0) + input_tokens
+        totals["output_tokens"] = (totals["output_tokens"] or 0) + output_tokens
+
+def record_openai_usage(usage):
+    # prompt_tokens already includes the cached part
+    if usage is None:
+        return
+    details = _field(usage, "prompt_tokens_details")
+    usage_stats.record(_field(usage, "prompt_tokens") or 0, _field(details, "cached_tokens") or 0,
+                       output_tokens=_field(usage, "completion_tokens") or 0)
+
+def record_anthropic_usage(usage):
+    # input_tokens only counts what came after the last cache breakpoint
+    if usage is None:
+        return
+    cached = _field(usage, "cache_read_input_tokens") or 0
+    written = _field(usage, "cache_creation_input_tokens") or 0
+    usage_stats.record((_field(usage, "input_tokens") or 0) + cached + written, cached, written, _field(usage, "output_tokens") or 0)
+
+def record_gemini_usage(usage):
+    # usage_metadata of a response, or of the last chunk of a stream (which has the totals)
+    if usage is None:
+        return
+    usage_stats.record(_field(usage, "prompt_token_count") or 0, _field(usage, "cached_content_token_count") or 0,
+                       output_tokens=_field(usage, "candidates_token_count") or 0)
+
+def record_mistral_usage(usage):
+    if usage is None:
+        return
+    usage_stats.record(_field(usage, "prompt_tokens") or 0, output_tokens=_field(usage, "completion_tokens") or 0)
@@ -1,12 +1,61 @@
 import os
 import base64
+import hashlib
 from PIL import Image
 from io import BytesIO
-from app.read_files import read_document, read_spreadsheet, process_image
+from app.read_files import read_document, read_spreadsheet, process_image, pdf_options, image_options, EXTRACTOR_VERSION
+from app.images import get_profile
+from app.spreadsheets import spreadsheet_options
+from app.cache import DiskCache, CACHE_DIR
+from app.scanner import scan_files
 
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB limit, can be adjusted
 
-def read_file(file_path, max_file_size=MAX_FILE_SIZE):
+# File types read_file handles; everything it handles is picked up from batch and context directories
+DOCUMENT_EXTENSIONS = ('.docx', '.doc', '.pdf', '.pptx', '.ppt', '.rtf', '.odt', '.txt', '.md', '.html', '.htm')
+SPREADSHEET_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp')
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.m4a')
+BATCH_FILE_EXTENSIONS = DOCUMENT_EXTENSIONS + SPREADSHEET_EXTENSIONS + IMAGE_EXTENSIONS + AUDIO_EXTENSIONS
+
+# Extracted text/images are cached on disk by file content, so re-running a batch skips parsing
+EXTRACTION_CACHE_ENABLED = os.getenv("BATCH_PROCESSOR_EXTRACTION_CACHE", "1") != "0"
+EXTRACTION_CACHE_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB, can be adjusted
+extraction_cache = DiskCache(os.path.join(CACHE_DIR, "extraction"), EXTRACTION_CACHE_SIZE)
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def extraction_cache_key(file_path, include_images=True, image_profile=None):
+    # Content hash + extractor version + extension (the extension picks the reader) + reader options.
+    # Image files also key on their path because read_image_file puts the path in its text.
+    _, ext = os.path.splitext(file_path)
+    ext = ext.lower()
+    key = f"{file_digest(file_path)}:{EXTRACTOR_VERSION}:{ext}:{include_images}"
+    if include_images:
+        key += ":{near_duplicate_distance}:{max_images}".format(**image_options())
+        key += f":{get_profile(image_profile)}"
+    if ext == '.pdf':
+        key += ":{pages}:{render_dpi}".format(**pdf_options())
+    if ext in SPREADSHEET_EXTENSIONS:
+        key += ":{max_rows}:{sample}:{columns}".format(**spreadsheet_options())
+    if ext in IMAGE_EXTENSIONS:
+        key += f":{os.path.abspath(file_path)}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def get_filtered_files(directory, **options):
+    # Paths, relative to the directory, of the files that aren't temporary files (do not start with '~$') and have a supported extension.
+    # Sorted, so context files always appear in the same order and requests share a byte-identical (cacheable) prefix.
+    # options: recursive, include, exclude, min_size, max_size (see app/scanner.py); the defaults come from BATCH_PROCESSOR_SCAN_*
+    return scan_files(directory, BATCH_FILE_EXTENSIONS, **options)
+
+def read_file(file_path, max_file_size=MAX_FILE_SIZE, use_cache=EXTRACTION_CACHE_ENABLED, include_images=True, image_profile=None):
+    # include_images=False skips image extraction for models that only take text;
+    # image_profile (a developer name) picks the image size/quality from IMAGE_PROFILES
     _, ext = os.path.splitext(file_path)
     ext = ext.lower()
 
@@ -14,25 +63,37 @@ def read_file(file_path, max_file_size=MAX_FILE_SIZE):
     if os.path.getsize(file_path) > max_file_size:
         raise ValueError(f"File size exceeds the maximum allowed size of {max_file_size / (1024 * 1024)} MB")
 
+    if use_cache and ext not in AUDIO_EXTENSIONS:
+        key = extraction_cache_key(file_path, include_images, image_profile)
+        cached = extraction_cache.get(key)
+        if cached is not None:
+            text, images = cached
+            return text, images
+        text, images = _read_file(file_path, ext, include_images, image_profile)
+        extraction_cache.set(key, [text, images])
+        return text, images
+    return _read_file(file_path, ext, include_images, image_profile)
+
+def _read_file(file_path, ext, include_images=True, image_profile=None):
     try:
-        if ext in ['.docx', '.doc', '.pdf', '.pptx', '.ppt', '.rtf', '.odt', '.txt', '.md', '.html', '.htm']:
-            return read_document(file_path)
-        elif ext in ['.xlsx', '.xls', '.csv']:
+        if ext in DOCUMENT_EXTENSIONS:
+            return read_document(file_path, include_images, image_profile)
+        elif ext in SPREADSHEET_EXTENSIONS:
             return read_spreadsheet(file_path)
-        elif ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-            return read_image_file(file_path)
-        elif ext in ['.mp3', '.wav', '.ogg', '.m4a']:
+        elif ext in IMAGE_EXTENSIONS:
+            return read_image_file(file_path, image_profile)
+        elif ext in AUDIO_EXTENSIONS:
             return f"Audio file: {file_path}", []  # Whisper model will handle transcription
         else:
             raise ValueError(f"Unsupported file format: {ext}")
     except Exception as e:
         raise IOError(f"Error reading file {file_path}: {str(e)}")
 
-def read_image_file(file_path):
+def read_image_file(file_path, image_profile=None):
     try:
         with open(file_path, "rb") as image_file:
             image_bytes = image_file.read()
-        img_str = process_image(image_bytes)  # Use process image to standardize image types
+        img_str = process_image(image_bytes, profile=image_profile)  # Use process image to standardize image types
         if img_str:
             return f"Image file: {file_path}", [img_str]
         else:
@@ -41,20 +102,6 @@ def read_image_file(file_path):
         raise IOError(f"Error processing image file {file_path}: {str(e)}")
 
 def read_context_files(file_paths):
-    context_content = []
-    for file_path in file_paths:
-        try:
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                with open(file_path, "rb") as image_file:
-                    image_bytes = image_file.read()
-                img_str = process_image(image_bytes)
-                if img_str:
-                    context_content.append(f"Image file: {os.path.basename(file_path)}\nBase64: {img_str[:20]}...")
-                else:
-                    context_content.append(f"Failed to process image file: {os.path.basename(file_path)}")
-            else:
-                content, _ = read_file(file_path)
-                context_content.append(f"Content of {os.path.basename(file_path)}:\n{content}\n")
-        except Exception as e:
-            context_content.append(f"Error reading {os.path.basename(file_path)}: {str(e)}\n")
-    return "\n".join(context_content)
\ No newline at end of file
+    # Kept for callers that want the plain-text context; the extraction itself is shared with ContextBundle
+    from app.context import get_context_bundle
+    return get_context_bundle(file_paths).summary_text()
\ No newline at end of file
@@ -0,0 +1,72 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+from app.scheduler import BatchScheduler
+from app.records import result_to_record
+from app.export import export_items
+from app.results_store import save_result
+
+class BatchWorker(QObject):
+    # Drives a BatchScheduler off the GUI thread. Move it to a QThread and connect the thread's
+    # started signal to run(); results come back to the GUI thread through result_ready.
+    result_ready = pyqtSignal(int, object, object, object)  # index, file path (None for a single prompt), result, stored result id
+    token_received = pyqtSignal(int, str)  # index, partial text (only when streaming)
+    finished = pyqtSignal(bool)  # True if the batch was cancelled
+
+    def __init__(self, developer, model, prompt, file_paths, chat_history=None, context_files=None, scheduler=None, stream=False, manifest=None,
+                 store=None, session_id=None):
+        super().__init__()
+        self.developer = developer
+        self.model = model
+        self.prompt = prompt
+        self.file_paths = file_paths
+        self.chat_history = chat_history
+        self.context_files = context_files
+        self.scheduler = scheduler or BatchScheduler()
+        self.stream = stream
+        self.manifest = manifest  # JobManifest checkpointing each file as it completes, optional
+        self.store = store  # ResultsStore every result is written to as it arrives, optional
+        self.session_id = session_id
+
+    def run(self):
+        try:
+            on_token = self.token_received.emit if self.stream else None
+            for index, file_path, result in self.scheduler.run(self.developer, self.model, self.prompt, self.file_paths, self.chat_history, self.context_files, on_token):
+                if self.manifest is not None and file_path is not None:
+                    self.checkpoint(index, file_path, result)
+                result_id = save_result(self.store, self.session_id, file_path, self.developer, self.model, self.prompt, result,
+                                        self.scheduler.request_stats.pop(index, None))
+                self.result_ready.emit(index, file_path, result, result_id)
+        except Exception as e:
+            self.result_ready.emit(-1, None, f"Error processing batch: {str(e)}", None)
+        self.finished.emit(self.scheduler.cancelled)
+
+    def checkpoint(self, index, file_path, result):
+        try:
+            self.manifest.record_result(file_path, result_to_record(index, file_path, self.developer, self.model, result))
+        except Exception as e:
+            print(f"Failed to checkpoint {file_path}: {str(e)}")
+
+    # Called directly from the GUI thread, the scheduler only flips thread-safe flags
+    def pause(self):
+        self.scheduler.pause()
+
+    def resume(self):
+        self.scheduler.resume()
+
+    def cancel(self):
+        self.scheduler.cancel()
+
+class ExportWorker(QObject):
+    # Writes the output to HTML off the GUI thread, same QThread wiring as BatchWorker
+    finished = pyqtSignal(object, str)  # files written, error message ("" on success)
+
+    def __init__(self, file_path, items):
+        super().__init__()
+        self.file_path = file_path
+        self.items = items  # A snapshot, the pane can keep changing while this runs
+
+    def run(self):
+        try:
+            files = export_items(self.file_path, self.items)
+            self.finished.emit(files, "")
+        except Exception as e:
+            self.finished.emit([], str(e))
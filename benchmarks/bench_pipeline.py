@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Every timing is cold: the extraction and response caches are off, and the in-memory image and context caches are
+# cleared before each run. The cache directory is a throwaway one so nothing from a real run is read back.
+os.environ["BATCH_PROCESSOR_EXTRACTION_CACHE"] = "0"
+os.environ["BATCH_PROCESSOR_RESPONSE_CACHE"] = "0"
+os.environ.setdefault("BATCH_PROCESSOR_CACHE_DIR", tempfile.mkdtemp(prefix="batch-processor-bench-"))
+
+import app.images as images
+import app.context as context
+import app.processor as processor
+from app.read_files import read_document, read_spreadsheet, process_image
+from app.utils import read_context_files, DOCUMENT_EXTENSIONS, SPREADSHEET_EXTENSIONS, IMAGE_EXTENSIONS
+from make_corpus import generate_corpus
+
+# Times the extraction and request-building path over a synthetic corpus (see make_corpus.py) and prints JSON,
+# so runs on two commits can be compared, e.g.
+#   python benchmarks/bench_pipeline.py --output before.json
+#   git checkout my-branch && python benchmarks/bench_pipeline.py --compare before.json
+# Pass --corpus to reuse a directory written by make_corpus.py instead of generating one each time.
+# Provider requests go to stub clients that answer at once, so "payload" timings are everything process_request
+# does before the network: reading the file, fitting the request to the model and building the provider's payload.
+
+PROMPT = "Summarize this file in five bullet points."
+PROVIDER_MODELS = {
+    "ChatGPT": "gpt-4o-mini",
+    "Claude": "claude-3-haiku-20240307",
+    "Gemini": "gemini-1.5-flash-001",
+    "Mistral": "open-mistral-nemo",
+}
+
+def stub_clients():
+    # Replaces the SDK clients and the rate limiter with stubs that return a canned response
+    reply = SimpleNamespace(usage=None, text="ok", content=[SimpleNamespace(text="ok")],
+                            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+    respond = lambda *args, **kwargs: reply
+    openai_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=respond)))
+    anthropic_client = SimpleNamespace(messages=SimpleNamespace(create=respond))
+    processor.get_openai_client = lambda: openai_client
+    processor.get_anthropic_client = lambda: anthropic_client
+    processor.get_gemini_model = lambda model: SimpleNamespace(generate_content=respond)
+    processor.get_mistral_client = lambda: SimpleNamespace(chat=respond)
+    processor.call_with_rate_limit = lambda developer, model, request, estimated_tokens=0: request()
+
+def clear_caches():
+    images.clear_image_cache()
+    with context._bundles_lock:
+        context._bundles.clear()
+
+def measure(function, repeat):
+    times = []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"min_seconds": round(min(times), 6), "median_seconds": round(statistics.median(times), 6)}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def check_result(result):
+    if processor.is_error_result(result):
+        raise RuntimeError(result)
+
+def cases(corpus):
+    # (benchmark, file name, function) for every file in the corpus
+    names = sorted(os.listdir(corpus))
+    paths = {name: os.path.join(corpus, name) for name in names}
+    for name in names:
+        ext = os.path.splitext(name)[1].lower()
+        path = paths[name]
+        if ext in DOCUMENT_EXTENSIONS:
+            yield "read_document", name, lambda path=path: read_document(path)
+        elif ext in SPREADSHEET_EXTENSIONS:
+            yield "read_spreadsheet", name, lambda path=path: read_spreadsheet(path)
+        elif ext in IMAGE_EXTENSIONS:
+            with open(path, "rb") as f:
+                data = f.read()
+            yield "process_image", name, lambda data=data: process_image(data)
+    context_paths = [paths[name] for name in names if os.path.splitext(name)[1].lower() in DOCUMENT_EXTENSIONS + IMAGE_EXTENSIONS]
+    yield "read_context_files", f"{len(context_paths)} files", lambda: read_context_files(context_paths)
+    for developer, model in PROVIDER_MODELS.items():
+        for name in names:
+            yield f"payload:{developer}", name, lambda developer=developer, model=model, path=paths[name]: check_result(
+                processor.process_request(developer, model, PROMPT, path))
+
+def compare(results, baseline_path):
+    # Adds the baseline's median and the change (negative is faster) to each result the baseline also has
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {(r["benchmark"], r["file"]): r for r in baseline.get("results", [])}
+    for result in results:
+        old = before.get((result["benchmark"], result["file"]))
+        if old and old.get("median_seconds"):
+            result["baseline_median_seconds"] = old["median_seconds"]
+            result["change"] = round(result["median_seconds"] / old["median_seconds"] - 1, 3)
+    return baseline.get("commit")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark file extraction and request building")
+    parser.add_argument("--corpus", help="Corpus directory from make_corpus.py (default: generate one in a temporary directory)")
+    parser.add_argument("--scale", type=int, default=1, help="Corpus scale when generating one")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; min and median are reported")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this, e.g. payload or read_document")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    corpus = args.corpus
+    if not corpus:
+        corpus = tempfile.mkdtemp(prefix="batch-processor-corpus-")
+        generate_corpus(corpus, args.scale)
+    stub_clients()
+    images.get_process_pool().submit(int).result()  # Start the pool outside the timing
+
+    results = []
+    for benchmark, name, function in cases(corpus):
+        if args.filter and args.filter not in benchmark:
+            continue
+        print(f"{benchmark} {name}", file=sys.stderr)
+        try:
+            results.append({"benchmark": benchmark, "file": name, **measure(function, args.repeat)})
+        except Exception as e:
+            results.append({"benchmark": benchmark, "file": name, "error": str(e)})
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "repeat": args.repeat,
+        "corpus": {name: os.path.getsize(os.path.join(corpus, name)) for name in sorted(os.listdir(corpus))},
+        "results": results,
+    }
+    if args.compare:
+        report["baseline_commit"] = compare([r for r in results if "median_seconds" in r], args.compare)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+import app.images as images
+
+# Compares the image transcoding path before the process pool (full-resolution decode + LANCZOS thumbnail,
+# one image at a time on the calling thread) with load_images (JPEG draft decoding, cache misses in a process pool), e.g.
+#   python benchmarks/bench_transcode.py --count 24 --megapixels 20
+
+def make_photo(width, height, seed):
+    # Smooth gradients plus noise, so the JPEG compresses like a camera photo rather than a flat test card
+    rng = random.Random(seed)
+    small = Image.new("RGB", (64, 48))
+    small.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(64 * 48)])
+    image = small.resize((width, height), Image.BICUBIC)
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    image = Image.blend(image, noise, 0.15)
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=92)
+    return buffered.getvalue()
+
+def legacy_transcode(data):
+    image = Image.open(io.BytesIO(data))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail(images.MAX_IMAGE_SIZE, Image.LANCZOS)
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=images.JPEG_QUALITY)
+    return buffered.getvalue()
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark image transcoding")
+    parser.add_argument("--count", type=int, default=16, help="Number of images")
+    parser.add_argument("--megapixels", type=float, default=20, help="Size of each image")
+    args = parser.parse_args(argv)
+
+    width = int((args.megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    print(f"Generating {args.count} {width}x{height} JPEGs...", file=sys.stderr)
+    photos = [make_photo(width, height, seed) for seed in range(args.count)]
+
+    legacy_seconds, _ = timed(lambda: [legacy_transcode(data) for data in photos])
+    images.get_process_pool().submit(int).result()  # Start the pool outside the timing
+    images.clear_image_cache()
+    pooled_seconds, results = timed(lambda: images.load_images(photos))
+    cached_seconds, _ = timed(lambda: images.load_images(photos))
+
+    report = {
+        "images": args.count,
+        "resolution": [width, height],
+        "workers": images.TRANSCODE_WORKERS,
+        "legacy_seconds": round(legacy_seconds, 3),
+        "pooled_draft_seconds": round(pooled_seconds, 3),
+        "cached_seconds": round(cached_seconds, 3),
+        "speedup": round(legacy_seconds / pooled_seconds, 2) if pooled_seconds else None,
+        "failed": sum(1 for result in results if result is None),
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import sys
+import json
+import time
+import email
+import argparse
+import threading
+from email import policy
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# A local stand-in for the OpenAI and Anthropic batch endpoints bulk mode uses (/v1/files, /v1/batches,
+# /v1/messages/batches), so --bulk can be run and timed without an account or any cost, e.g.
+#   python benchmarks/bulk_standin.py --port 8765 --delay 5
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 ANTHROPIC_BASE_URL=http://127.0.0.1:8765 \
+#       python cli.py --bulk --poll-interval 2 --dir batch_files --prompt "Summarize" --developer Claude --model claude-3-haiku-20240307
+# Every request is answered with a short text saying what it received. Batches end --delay seconds after submission.
+# Everything is kept in memory; nothing is checked beyond what bulk mode needs.
+# This is a manual tool for trying out and timing bulk runs by hand; no automated check runs against it.
+
+class StandIn:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.files = {}  # file id -> bytes
+        self.batches = {}  # batch id -> dict
+        self.count = 0
+
+    def next_id(self, prefix):
+        with self.lock:
+            self.count += 1
+            return f"{prefix}_{self.count:06d}"
+
+def describe(body):
+    # The canned answer: what the request contained, so a run can be checked end to end
+    messages = body.get("messages", [])
+    parts = sum(len(m["content"]) if isinstance(m.get("content"), list) else 1 for m in messages)
+    size = len(json.dumps(body))
+    return f"Stand-in response for {body.get('model')}: {len(messages)} messages, {parts} parts, {size} bytes"
+
+def openai_output(lines):
+    output = []
+    for line in lines.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        text = describe(item["body"])
+        output.append(json.dumps({"custom_id": item["custom_id"], "response": {"status_code": 200, "body": {
+            "choices": [{"message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": len(line) // 4, "completion_tokens": len(text) // 4},
+        }}}))
+    return "\n".join(output).encode()
+
+def anthropic_output(requests):
+    output = []
+    for item in requests:
+        text = describe(item["params"])
+        output.append(json.dumps({"custom_id": item["custom_id"], "result": {"type": "succeeded", "message": {
+            "content": [{"type": "text", "text": text}],
+            "usage": {"input_tokens": len(json.dumps(item["params"])) // 4, "output_tokens": len(text) // 4},
+        }}}))
+    return "\n".join(output).encode()
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            print(f"{self.command} {self.path}", file=sys.stderr)
+
+        def send(self, payload, status=200, content_type="application/json"):
+            data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def batch(self, batch_id):
+            batch = state.batches.get(batch_id)
+            if batch is None:
+                self.send({"error": {"message": f"No batch {batch_id}"}}, 404)
+            return batch
+
+        def do_POST(self):
+            if self.path == "/v1/files":
+                # Multipart upload: the "file" part is the batch input
+                message = email.message_from_bytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + self.body(),
+                                                   policy=policy.default)
+                content = next(part.get_payload(decode=True) for part in message.iter_parts()
+                               if part.get_param("name", header="content-disposition") == "file")
+                file_id = state.next_id("file")
+                state.files[file_id] = content
+                self.send({"id": file_id, "object": "file", "purpose": "batch", "bytes": len(content)})
+            elif self.path == "/v1/batches":
+                request = json.loads(self.body())
+                batch_id = state.next_id("batch")
+                output_id = state.next_id("file")
+                state.files[output_id] = openai_output(state.files[request["input_file_id"]].decode())
+                state.batches[batch_id] = {"id": batch_id, "ends_at": time.time() + state.delay, "output_file_id": output_id}
+                self.send({"id": batch_id, "status": "validating"})
+            elif self.path == "/v1/messages/batches":
+                request = json.loads(self.body())
+                batch_id = state.next_id("msgbatch")
+                output_id = state.next_id("file")
+                state.files[output_id] = anthropic_output(request["requests"])
+                state.batches[batch_id] = {"id": batch_id, "ends_at": time.time() + state.delay, "output_file_id": output_id}
+                self.send({"id": batch_id, "processing_status": "in_progress"})
+            else:
+                self.send({"error": {"message": f"Unknown endpoint {self.path}"}}, 404)
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if parts[:2] == ["v1", "batches"] and len(parts) == 3:
+                batch = self.batch(parts[2])
+                if batch is not None:
+                    done = time.time() >= batch["ends_at"]
+                    self.send({"id": batch["id"], "status": "completed" if done else "in_progress",
+                               "output_file_id": batch["output_file_id"] if done else None, "error_file_id": None})
+            elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content":
+                content = state.files.get(parts[2])
+                if content is None:
+                    self.send({"error": {"message": f"No file {parts[2]}"}}, 404)
+                else:
+                    self.send(content, content_type="application/jsonl")
+            elif parts[:3] == ["v1", "messages", "batches"] and len(parts) == 4:
+                batch = self.batch(parts[3])
+                if batch is not None:
+                    done = time.time() >= batch["ends_at"]
+                    host = self.headers.get("Host")
+                    self.send({"id": batch["id"], "processing_status": "ended" if done else "in_progress",
+                               "results_url": f"http://{host}/v1/messages/batches/{batch['id']}/results" if done else None})
+            elif parts[:3] == ["v1", "messages", "batches"] and len(parts) == 5 and parts[4] == "results":
+                batch = self.batch(parts[3])
+                if batch is not None:
+                    self.send(state.files[batch["output_file_id"]], content_type="application/x-jsonl")
+            else:
+                self.send({"error": {"message": f"Unknown endpoint {self.path}"}}, 404)
+
+    return Handler
+
+def serve(port=8765, delay=0, host="127.0.0.1"):
+    # Returns the running server; call shutdown() to stop it
+    server = ThreadingHTTPServer((host, port), make_handler(StandIn(delay)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI and Anthropic batch APIs")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0, help="Seconds before a submitted batch ends")
+    args = parser.parse_args(argv)
+    server = serve(args.port, args.delay)
+    print(f"Listening on http://127.0.0.1:{args.port} (OPENAI_BASE_URL=http://127.0.0.1:{args.port}/v1, "
+          f"ANTHROPIC_BASE_URL=http://127.0.0.1:{args.port})", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
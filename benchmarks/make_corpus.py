@@ -0,0 +1,123 @@
+import os
+import sys
+import io
+import csv
+import json
+import argparse
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fitz  # PyMuPDF
+import openpyxl
+from docx import Document
+from docx.shared import Inches
+from pptx import Presentation
+from pptx.util import Inches as PptxInches
+from PIL import Image
+from bench_transcode import make_photo
+
+# Writes a synthetic corpus for the benchmarks: PDFs with text and images, DOCX, PPTX, a large CSV and XLSX,
+# and big JPEG/PNG files. Everything is seeded, so the same scale always gives the same files, e.g.
+#   python benchmarks/make_corpus.py corpus --scale 2
+# scale multiplies page, slide, row counts and image resolution; 1 takes about 15 seconds and ~40 MB.
+
+WORDS = ("batch model prompt context report revenue quarter growth customer product market analysis result "
+         "summary document table figure section review update forecast risk cost team plan data").split()
+
+def paragraph(rng, words=80):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def photo(rng, megapixels):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    return make_photo(width, int(width * 3 / 4), rng.randrange(1 << 30))
+
+def make_pdf(path, rng, pages, images_per_page=1):
+    document = fitz.open()
+    for number in range(pages):
+        page = document.new_page()
+        text = f"Page {number + 1}\n\n" + "\n\n".join(paragraph(rng) for _ in range(4))
+        if page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, 420), text, fontsize=9) < 0:
+            raise ValueError("Page text doesn't fit its box")  # insert_textbox writes nothing rather than overflow
+        for n in range(images_per_page):
+            page.insert_image(fitz.Rect(50 + n * 160, 440, 200 + n * 160, 552), stream=photo(rng, 1))
+    document.save(path)
+    document.close()
+
+def make_docx(path, rng, paragraphs, images):
+    document = Document()
+    document.add_heading("Synthetic report", 0)
+    for n in range(paragraphs):
+        document.add_paragraph(paragraph(rng))
+        if images and n % max(1, paragraphs // images) == 0:
+            document.add_picture(io.BytesIO(photo(rng, 2)), width=Inches(4))
+    document.save(path)
+
+def make_pptx(path, rng, slides):
+    presentation = Presentation()
+    for number in range(slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[5])  # Title only
+        slide.shapes.title.text = f"Slide {number + 1}"
+        textbox = slide.shapes.add_textbox(PptxInches(0.5), PptxInches(1.5), PptxInches(4.5), PptxInches(4))
+        textbox.text_frame.word_wrap = True
+        textbox.text_frame.text = paragraph(rng, 40)
+        slide.shapes.add_picture(io.BytesIO(photo(rng, 2)), PptxInches(5.2), PptxInches(1.5), width=PptxInches(4.3))
+    presentation.save(path)
+
+def table_rows(rng, rows):
+    yield ["id", "date", "region", "product", "units", "price", "notes"]
+    for n in range(rows):
+        yield [n + 1, f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}", rng.choice(["north", "south", "east", "west"]),
+               rng.choice(WORDS), rng.randrange(1, 500), round(rng.uniform(1, 1000), 2), paragraph(rng, 6)]
+
+def make_csv(path, rng, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(table_rows(rng, rows))
+
+def make_xlsx(path, rng, rows):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sales")
+    for row in table_rows(rng, rows):
+        sheet.append(row)
+    workbook.save(path)
+
+def write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def make_png(path, rng, megapixels):
+    Image.open(io.BytesIO(photo(rng, megapixels))).save(path, format="PNG")
+
+def generate_corpus(directory, scale=1, seed=0):
+    # Returns {file name: size in bytes}
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    steps = [
+        ("report.pdf", lambda path: make_pdf(path, rng, pages=20 * scale)),
+        ("scan.pdf", lambda path: make_pdf(path, rng, pages=5 * scale, images_per_page=3)),
+        ("report.docx", lambda path: make_docx(path, rng, paragraphs=200 * scale, images=5 * scale)),
+        ("deck.pptx", lambda path: make_pptx(path, rng, slides=15 * scale)),
+        ("sales.csv", lambda path: make_csv(path, rng, rows=100000 * scale)),
+        ("sales.xlsx", lambda path: make_xlsx(path, rng, rows=20000 * scale)),
+        ("photo.jpg", lambda path: write_file(path, photo(rng, 12 * scale))),
+        ("screenshot.png", lambda path: make_png(path, rng, 4 * scale)),
+        ("notes.txt", lambda path: write_file(path, "\n\n".join(paragraph(rng) for _ in range(300 * scale)).encode())),
+    ]
+    sizes = {}
+    for name, make in steps:
+        path = os.path.join(directory, name)
+        print(f"Writing {path}", file=sys.stderr)
+        make(path)
+        sizes[name] = os.path.getsize(path)
+    return sizes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic corpus for the benchmarks")
+    parser.add_argument("directory")
+    parser.add_argument("--scale", type=int, default=1, help="Multiplies pages, rows and image sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    print(json.dumps(generate_corpus(args.directory, args.scale, args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
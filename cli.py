@@ -0,0 +1,211 @@
+import sys
+import os
+import json
+import time
+import argparse
+from app.scheduler import BatchScheduler, MAX_CONCURRENT_REQUESTS
+from app.records import result_to_record
+from app.manifest import JobManifest
+from app.bulk import submit_bulk, poll_bulk, BULK_DEVELOPERS, BULK_POLL_INTERVAL
+from app.utils import get_filtered_files, BATCH_FILE_EXTENSIONS
+from app.scanner import DirectoryWatcher, SCAN_RECURSIVE, SCAN_MIN_SIZE, SCAN_MAX_SIZE, WATCH_INTERVAL
+from app.usage import usage_stats
+from app.response_cache import set_response_cache, response_cache_summary, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_TTL
+from app.history import HistoryManager
+from app.read_files import set_pdf_options, PDF_PAGES, PDF_RENDER_DPI
+from app.spreadsheets import set_spreadsheet_options, SHEET_MAX_ROWS, SHEET_SAMPLE, SHEET_COLUMNS
+
+# Headless batch runner: drives the same process_request pipeline as the UI without PyQt6 and writes
+# one JSON line per result as soon as it completes, e.g.
+#   python cli.py --dir batch_files --prompt "Summarize this file" --developer Claude --model claude-3-haiku-20240307 > results.jsonl
+# Directory runs are checkpointed, so running the same command again only processes files that failed or never finished.
+# --bulk submits the whole directory through the provider's batch API instead; re-running a bulk job keeps polling
+# the batches it already submitted rather than paying for them twice.
+# --watch keeps running and processes files as they are added to (or changed in) the directory, e.g. a drop folder.
+
+DEVELOPERS = ["ChatGPT", "Claude", "Gemini", "Mistral"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a prompt over every file in a directory without the UI.")
+    parser.add_argument("--dir", help="Batch processing directory. Without it the prompt is sent once on its own.")
+    prompt_group = parser.add_mutually_exclusive_group(required=True)
+    prompt_group.add_argument("--prompt", help="Prompt text")
+    prompt_group.add_argument("--prompt-file", help="Read the prompt from this file")
+    parser.add_argument("--developer", required=True, choices=DEVELOPERS)
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--context-dir", help="Directory of context files included with every request")
+    parser.add_argument("--recursive", action=argparse.BooleanOptionalAction, default=SCAN_RECURSIVE, help="Include files in subdirectories of --dir and --context-dir (--no-recursive overrides BATCH_PROCESSOR_SCAN_RECURSIVE=1)")
+    parser.add_argument("--include", action="append", help='Only process files matching this glob, e.g. "*.pdf" or "reports/*" (repeatable)')
+    parser.add_argument("--exclude", action="append", help='Skip files matching this glob (repeatable)')
+    parser.add_argument("--min-size", type=int, default=SCAN_MIN_SIZE, help="Skip files smaller than this many bytes")
+    parser.add_argument("--max-size", type=int, default=SCAN_MAX_SIZE, help="Skip files larger than this many bytes (0 for no limit)")
+    parser.add_argument("--watch", action="store_true", help="Keep watching --dir and process new or changed files as they arrive (Ctrl+C to stop)")
+    parser.add_argument("--watch-interval", type=float, default=WATCH_INTERVAL, help="Seconds between scans in --watch mode")
+    parser.add_argument("--history", help="JSONL output of an earlier run to include as chat history")
+    parser.add_argument("--output", default="-", help="JSONL file to append results to (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_REQUESTS, help="Requests kept in flight")
+    parser.add_argument("--order-by-size", action="store_true", help="Start the largest files first")
+    parser.add_argument("--map-reduce", action="store_true", help="Process documents too long for the model in parts and combine the answers")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of an earlier run of this job and process every file again")
+    parser.add_argument("--response-cache", action=argparse.BooleanOptionalAction, default=RESPONSE_CACHE_ENABLED, help="Reuse the responses to identical earlier requests instead of sending them again (--no-response-cache overrides BATCH_PROCESSOR_RESPONSE_CACHE=1)")
+    parser.add_argument("--response-cache-ttl", type=int, default=RESPONSE_CACHE_TTL, help="Seconds a cached response stays valid")
+    parser.add_argument("--bulk", action="store_true", help=f"Use the provider batch API ({', '.join(BULK_DEVELOPERS)}); slower to finish, higher throughput and lower cost")
+    parser.add_argument("--pdf-pages", default=PDF_PAGES, help='Only read these PDF pages, e.g. "1-10,15"')
+    parser.add_argument("--pdf-render-dpi", type=int, default=PDF_RENDER_DPI, help="Send PDF pages as images rendered at this DPI instead of their embedded images (for scanned PDFs)")
+    parser.add_argument("--sheet-rows", type=int, default=SHEET_MAX_ROWS, help="Rows of each spreadsheet sheet to include (column stats always cover every row)")
+    parser.add_argument("--sheet-sample", choices=["head", "tail", "random"], default=SHEET_SAMPLE, help="Which spreadsheet rows to include")
+    parser.add_argument("--sheet-columns", default=SHEET_COLUMNS, help='Only include these spreadsheet columns, by name or number, e.g. "date,amount"')
+    parser.add_argument("--poll-interval", type=int, default=BULK_POLL_INTERVAL, help="Seconds between batch status checks in --bulk mode")
+    return parser.parse_args(argv)
+
+def load_history(path):
+    # Turns the records of an earlier run into the (type, content) chat history the providers expect,
+    # keeping the most recent results that fit the history budget
+    history = HistoryManager()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("status") != "ok":
+                continue
+            source = os.path.basename(record["file"]) if record.get("file") else None
+            history.add_turn(None, record.get("text"), record.get("images", []), source)
+    return history.items()
+
+def run_bulk_job(args, manifest, prompt, file_paths, chat_history, context_files, emit):
+    # Batches submitted by an earlier run of this job are polled again, only files not in one of them are submitted
+    batches = manifest.state.get("bulk_batches", [])
+    submitted = {file_path for batch in batches for file_path in batch["files"].values()}
+    to_submit = [f for f in file_paths if f not in submitted]
+    if to_submit:
+        new_batches, errors = submit_bulk(args.developer, args.model, prompt, to_submit, chat_history, context_files)
+        batches = batches + new_batches
+        manifest.update_state(bulk_batches=batches)
+        for file_path, error in errors.items():
+            emit(file_path, error)
+    print(f"Waiting for {len(batches)} batch(es), checking every {args.poll_interval}s", file=sys.stderr)
+    pending = set(file_paths)
+    for file_path, result in poll_bulk(batches, args.poll_interval):
+        if file_path in pending:
+            emit(file_path, result)
+    manifest.update_state(bulk_batches=[])
+
+def wait_for_files(watcher, manifest, interval):
+    # Scans the watched directory until files arrive that still need a request (new, changed, or never completed)
+    while True:
+        time.sleep(interval)
+        file_paths = [os.path.join(watcher.directory, f) for f in watcher.poll()]
+        if file_paths:
+            manifest.add_files(file_paths)
+            file_paths = manifest.pending_files(file_paths)
+        if file_paths:
+            print(f"{len(file_paths)} new or changed file(s) in {watcher.directory}", file=sys.stderr)
+            return file_paths
+
+def main(argv=None):
+    args = parse_args(argv)
+    set_pdf_options(args.pdf_pages, args.pdf_render_dpi)
+    set_spreadsheet_options(args.sheet_rows, args.sheet_sample, args.sheet_columns)
+    set_response_cache(args.response_cache, args.response_cache_ttl)
+
+    if args.prompt_file:
+        with open(args.prompt_file, "r", encoding="utf-8") as f:
+            prompt = f.read()
+    else:
+        prompt = args.prompt
+    if not prompt.strip():
+        print("Please provide a prompt", file=sys.stderr)
+        return 2
+    if args.bulk and (not args.dir or args.developer not in BULK_DEVELOPERS):
+        print(f"--bulk needs --dir and one of: {', '.join(BULK_DEVELOPERS)}", file=sys.stderr)
+        return 2
+    if args.bulk and args.map_reduce:
+        print("--map-reduce can't be combined with --bulk", file=sys.stderr)
+        return 2
+    if args.watch and (not args.dir or args.bulk):
+        print("--watch needs --dir and can't be combined with --bulk", file=sys.stderr)
+        return 2
+
+    scan_options = dict(recursive=args.recursive, include=args.include, exclude=args.exclude, min_size=args.min_size, max_size=args.max_size)
+    watcher = None
+    if args.watch:
+        watcher = DirectoryWatcher(args.dir, BATCH_FILE_EXTENSIONS, **scan_options)
+        file_paths = [os.path.join(args.dir, f) for f in watcher.poll()]
+        print(f"Watching {args.dir} every {args.watch_interval}s (Ctrl+C to stop)", file=sys.stderr)
+    elif args.dir:
+        file_paths = [os.path.join(args.dir, f) for f in get_filtered_files(args.dir, **scan_options)]
+        if not file_paths:
+            print(f"No supported files found in {args.dir}", file=sys.stderr)
+            return 2
+    else:
+        file_paths = [None]
+
+    context_files = None
+    if args.context_dir:
+        context_files = [os.path.join(args.context_dir, f) for f in get_filtered_files(args.context_dir, recursive=args.recursive)] or None
+
+    chat_history = load_history(args.history) if args.history else None
+
+    manifest = None
+    all_files = file_paths
+    if args.dir:
+        manifest = JobManifest.open_job(args.dir, args.developer, args.model, prompt, file_paths, context_files, restart=args.restart)
+        file_paths = manifest.pending_files(file_paths)
+        skipped = len(all_files) - len(file_paths)
+        print(f"Job {manifest.job_id}: {skipped} of {len(all_files)} files already completed, {len(file_paths)} to process", file=sys.stderr)
+        if not file_paths and not watcher:
+            manifest.close()
+            return 0
+    positions = {file_path: i for i, file_path in enumerate(all_files)}
+    total = len(file_paths)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    scheduler = BatchScheduler(max_workers=args.concurrency, order_by_size=args.order_by_size, map_reduce=args.map_reduce)
+    failed = 0
+    processed = 0
+
+    def emit(file_path, result):
+        nonlocal failed, processed
+        record = result_to_record(positions.setdefault(file_path, len(positions)), file_path, args.developer, args.model, result)
+        if record["status"] != "ok":
+            failed += 1
+        processed += 1
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+        if manifest:
+            manifest.record_result(file_path, record)
+        print(f"Processed {processed} of {total}: {file_path or 'prompt'} [{record['status']}]", file=sys.stderr)
+
+    try:
+        if args.bulk:
+            run_bulk_job(args, manifest, prompt, file_paths, chat_history, context_files, emit)
+        else:
+            while True:
+                for _, file_path, result in (scheduler.run(args.developer, args.model, prompt, file_paths, chat_history, context_files) if file_paths else []):
+                    emit(file_path, result)
+                if not watcher:
+                    break
+                file_paths = wait_for_files(watcher, manifest, args.watch_interval)
+                total += len(file_paths)
+    except KeyboardInterrupt:
+        scheduler.cancel()
+        if not watcher:
+            print("Cancelled", file=sys.stderr)
+            return 130
+        print("Stopped watching", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if manifest:
+            manifest.close()
+
+    print(f"Done: {processed - failed} succeeded, {failed} failed", file=sys.stderr)
+    if usage_stats.summary():
+        print(usage_stats.summary(), file=sys.stderr)
+    if response_cache_summary():
+        print(response_cache_summary(), file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())